@@ -0,0 +1,330 @@
+#!/usr/bin/python
+# vim: et ts=4 sw=4
+""" Read-only inventory queries """
+from __future__ import print_function
+import textwrap
+import threading
+from flask import Blueprint, jsonify, request
+from pyVmomi import vim # pylint: disable=no-name-in-module
+#
+from vctools.argparser import ArgParser
+from vctools.auth import SessionPool
+from vctools.cache import InventoryCache
+from vctools.collector import Collector
+from vctools.inventory import FolderIndex, NameIndex
+from vctools.query import Query
+from vctools.sync import SyncedInventory
+from vctools.views import ViewManager
+from vctools import Logger
+
+query = Blueprint('query', __name__)
+
+class UnknownHost(Exception):
+    """ Raised for a vCenter that is not configured for the API. """
+    pass
+
+
+class Inventory(Logger):
+    """
+    Class keeps a pool of long-lived sessions per vCenter, so API requests
+    don't pay for a login or wait for each other, and answers them from the
+    inventory cache while the results of each object type are fresh.
+    Credentials are read from the general section of the dotrc file, which
+    must include a passwd_file.  Only the vCenters listed in the hosts of the
+    api section, or in a hostgroup, are queried, so the credentials are never
+    sent to a host picked by an API caller.  The number of sessions per
+    vCenter is set in the api section as well:
+
+        api:
+          sessions: 4
+          hosts:
+            - vcenter01.domain.com
+    """
+    # inventories, keyed by vCenter host
+    inventories = {}
+    lock = threading.Lock()
+    dotrc = None
+
+    def __init__(self, host):
+        """
+        Args:
+            host (str): vCenter host
+        """
+        general = self.config().get('general', None) or {}
+
+        if not general.get('passwd_file', None):
+            raise ValueError('passwd_file is required in the general section of the dotrc.')
+
+        self.host = host
+        self.pool = SessionPool(
+            host, (self.config().get('api', None) or {}).get('sessions', 4),
+            user=general.get('user', None), domain=general.get('domain', None),
+            passwd_file=general['passwd_file']
+        )
+        self.cache = InventoryCache(
+            host, True, False, **InventoryCache.options(self.config().get('cache', None))
+        )
+
+    @classmethod
+    def config(cls):
+        """ Returns the dotrc file, which is loaded once. """
+        if cls.dotrc is None:
+            cls.dotrc = ArgParser().dotrc
+
+        return cls.dotrc
+
+    @classmethod
+    def allowed_hosts(cls):
+        """ Returns the vCenters of the api hosts and of every hostgroup. """
+        hosts = set((cls.config().get('api', None) or {}).get('hosts', None) or [])
+        for group in (cls.config().get('hostgroups', None) or {}).itervalues():
+            hosts.update(group or [])
+
+        return hosts
+
+    @classmethod
+    def for_host(cls, host):
+        """
+        Returns the inventory of host, creating it if necessary, or raises
+        UnknownHost if host is not configured.
+
+        Args:
+            host (str): vCenter host
+        """
+        if host not in cls.allowed_hosts():
+            raise UnknownHost('%s is not a configured vCenter.' % (host))
+
+        with cls.lock:
+            if host not in cls.inventories:
+                cls.inventories[host] = cls(host)
+
+            return cls.inventories[host]
+
+    @classmethod
+    def view(cls, session, *types):
+        """
+        Returns the ContainerView of types on a pooled session.  The name and
+        folder indexes of the session are dropped first: results are only
+        fetched from vCenter once the cached ones expired or with ?refresh=1,
+        and the indexes of a long-lived session would otherwise never see the
+        entities created since they were built.
+
+        Args:
+            session (obj): ServiceInstance
+            types (obj):   Managed object types, i.e. vim.VirtualMachine
+        """
+        NameIndex.invalidate_session(session._stub)
+        FolderIndex.invalidate_session(session._stub)
+
+        return ViewManager.for_session(session).view(*types)
+
+    def call(self, func, *types):
+        """
+        Method calls func with the ContainerView of types on a session of the
+        pool.  If vCenter expired the session, it is called once more on
+        another one.
+
+        Args:
+            func (obj):  Callable that takes a ContainerView
+            types (obj): Managed object types, i.e. vim.VirtualMachine
+        """
+        try:
+            with self.pool.session() as session:
+                return func(self.view(session, *types))
+        except vim.fault.NotAuthenticated:
+            self.logger.info('%s session expired', self.host)
+
+        with self.pool.session() as session:
+            return func(self.view(session, *types))
+
+    def synced(self):
+        """
+        Returns the inventory stored by vctools sync while it is fresh, or
+        None.  ?refresh=1 skips it.
+        """
+        if request.args.get('refresh', None):
+            return None
+
+        return SyncedInventory.for_cache(self.cache)
+
+    def fetch(self, obj_type, scope, func, *types):
+        """
+        Method returns the cached rows for obj_type and scope, or calls func
+        and caches its result.  ?refresh=1 skips the cached rows.
+
+        Args:
+            obj_type (str): Object type, i.e. clusters
+            scope (str):    Name of the cluster or datacenter queried
+            func (obj):     Callable that takes a ContainerView
+            types (obj):    Managed object types of the ContainerView
+        """
+        rows = None
+        if not request.args.get('refresh', None):
+            rows = self.cache.get(obj_type, scope)
+
+        if rows is None:
+            rows = self.call(func, *types)
+            self.cache.set(obj_type, scope, rows)
+
+        return rows
+
+
+def required(name):
+    """ Returns the request argument name, or raises ValueError if it is missing. """
+    value = request.args.get(name, None)
+    if not value:
+        raise ValueError('%s is required.' % (name))
+
+    return value
+
+
+@query.errorhandler(ValueError)
+def bad_request(err):
+    """ Returns errors of the Query layer as json. """
+    response = jsonify({'error': str(err)})
+    response.status_code = 400
+    return response
+
+
+@query.errorhandler(UnknownHost)
+def not_found(err):
+    """ Returns vCenters that are not configured as json. """
+    response = jsonify({'error': str(err)})
+    response.status_code = 404
+    return response
+
+
+@query.route('/')
+def root():
+    """
+    GET /query/<host>/<resource>
+
+    host is one of the vCenters in the hosts of the api section or in a
+    hostgroup of the dotrc file, other hosts are 404 Not Found.
+
+    Read-only inventory queries.  A session to each vCenter is kept open, and
+    results are cached per resource for the ttl in the cache section of the
+    dotrc file.  While vctools sync keeps the inventory of a vCenter fresh,
+    queries are answered from it instead.  Add refresh=1 to skip the cached
+    results.
+
+    The cache of the API is separate from the one of the CLI: it lives in
+    the home of the user running the API, unless the cache path of the dotrc
+    file is shared, and the API keeps its own index of names.  Changes made
+    with vctools are only seen once the cached results expire, or with
+    refresh=1.
+
+    resource:
+        clusters                            Names of clusters.
+        datastores[?cluster=<name>]         Disk space of datastores, every
+                                            cluster if cluster is omitted.
+        networks?cluster=<name>             Names of networks.
+        folders?datacenter=<name>           Paths of VM folders.
+        vms[?datacenter=<name>][&properties=power,host,ip,guestId]
+                                            Names and moIds of VMs, every
+                                            datacenter if datacenter is omitted.
+        vmconfig/<name>                     Config of a VM.
+
+    Example:
+
+        curl -k https://hostname.domain.com/query/vcenter/datastores?cluster=cluster
+    """
+    return textwrap.dedent(root.__doc__)
+
+
+@query.route('/<host>/clusters')
+def clusters(host):
+    """ GET /query/<host>/clusters """
+    inventory = Inventory.for_host(host)
+    synced = inventory.synced()
+    rows = synced.clusters() if synced else inventory.fetch(
+        'clusters', '',
+        lambda view: [props['name'] for dummy, props in Collector.retrieve(view, ['name'])],
+        vim.ClusterComputeResource
+    )
+
+    return jsonify({'clusters': sorted(rows)})
+
+
+@query.route('/<host>/datastores')
+def datastores(host):
+    """ GET /query/<host>/datastores[?cluster=<name>] """
+    cluster = request.args.get('cluster', None)
+    fields = list(Query.datastore_fields)
+    inventory = Inventory.for_host(host)
+    synced = inventory.synced()
+
+    if cluster:
+        rows = synced.datastores(cluster) if synced else inventory.fetch(
+            'datastores', cluster, lambda view: Query.return_datastores(view, cluster),
+            vim.ClusterComputeResource
+        )
+    else:
+        fields.append('clusters')
+        rows = synced.datastores() if synced else inventory.fetch(
+            'datastores', '', Query.return_all_datastores, vim.ClusterComputeResource
+        )
+
+    return jsonify({'datastores': [dict(zip(fields, row)) for row in rows[1:]]})
+
+
+@query.route('/<host>/networks')
+def networks(host):
+    """ GET /query/<host>/networks?cluster=<name> """
+    cluster = required('cluster')
+    inventory = Inventory.for_host(host)
+    synced = inventory.synced()
+    rows = synced.networks(cluster) if synced else inventory.fetch(
+        'networks', cluster, lambda view: Query.list_obj_attrs(
+            Query.get_obj(view, cluster).network, 'name', view=False
+        ),
+        vim.ClusterComputeResource
+    )
+
+    return jsonify({'networks': sorted(rows)})
+
+
+@query.route('/<host>/folders')
+def folders(host):
+    """ GET /query/<host>/folders?datacenter=<name> """
+    datacenter = required('datacenter')
+    inventory = Inventory.for_host(host)
+    synced = inventory.synced()
+    rows = synced.folders(datacenter) if synced else inventory.fetch(
+        'folders', datacenter, lambda view: Query.list_vm_folders(view, datacenter),
+        vim.Datacenter
+    )
+
+    return jsonify({'folders': sorted(rows)})
+
+
+@query.route('/<host>/vms')
+def vms(host):
+    """ GET /query/<host>/vms[?datacenter=<name>][&properties=power,host,ip,guestId] """
+    datacenter = request.args.get('datacenter', None)
+    properties = [prop for prop in request.args.get('properties', '').split(',') if prop]
+
+    for prop in properties:
+        if prop not in Query.vm_info_paths:
+            raise ValueError('%s is not a VM property.' % (prop))
+
+    inventory = Inventory.for_host(host)
+    synced = inventory.synced()
+    rows = synced.vms(datacenter, properties) if synced else inventory.fetch(
+        'vms', ' '.join([datacenter or ''] + properties),
+        lambda view: list(Query.list_vm_info(view, datacenter, properties)),
+        vim.Datacenter
+    )
+    fields = ['name', 'moid'] + properties
+
+    return jsonify({'vms': [dict(zip(fields, row)) for row in rows]})
+
+
+@query.route('/<host>/vmconfig/<name>')
+def vmconfig(host, name):
+    """ GET /query/<host>/vmconfig/<name> """
+    cfg = Inventory.for_host(host).fetch(
+        'vmconfig', name, lambda view: Query.vm_config(view, name), vim.VirtualMachine
+    )
+
+    return jsonify(cfg)
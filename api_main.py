@@ -6,6 +6,7 @@ import textwrap
 from flask import Flask
 #
 from api.mkbootiso import mkbootiso
+from api.query import query
 
 vctools_api = Flask(__name__)
 
@@ -13,6 +14,7 @@ vctools_api = Flask(__name__)
 vctools_api.url_map.strict_slashes = False
 #
 vctools_api.register_blueprint(mkbootiso, url_prefix='/mkbootiso')
+vctools_api.register_blueprint(query, url_prefix='/query')
 
 @vctools_api.route('/')
 def root():
@@ -23,6 +25,7 @@ def root():
 
     command:
         mkbootiso     Create a boot.iso on a per server basis.
+        query         Read-only inventory queries of a vCenter.
 
     """
     return textwrap.dedent(root.__doc__)
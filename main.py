@@ -7,41 +7,53 @@ operations inside VMWare vCenter.
 https://github.com/mdechiaro/vctools/
 """
 from __future__ import print_function
+import copy
+import json
 import logging
-from getpass import getuser
+from getpass import getpass, getuser
+import os
 import sys
 import yaml
 #
-from pyVmomi import vim # pylint: disable=no-name-in-module
 from vctools.argparser import ArgParser
-from vctools.auth import Auth
-from vctools.vmconfig_helper import VMConfigHelper
-from vctools.clusterconfig import ClusterConfig
-from vctools.prompts import Prompts
-from vctools.query import Query
-from vctools.cfgchecker import CfgCheck
 from vctools import Logger
 
 class VCTools(Logger):
     """
     Main VCTools class.
     """
-
     def __init__(self, opts):
         self.opts = opts
         self.auth = None
+        self.cache = None
+        self.output = None
         self.vmcfg = None
         self.clustercfg = None
 
-    def main(self):
-        """
-        This is the main method, which parses all the argparse options and runs
-        the necessary code blocks if True.
+    def connect(self, host):
         """
+        Method prepares the session and inventory cache of host.  Logging in
+        is left to the first call of login.
 
-        try:
+        Args:
+            host (str): vCenter host
+        """
+        self.auth = Auth(host, reuse=self.opts.session_cache)
+        self.cache = InventoryCache(
+            host, getattr(self.opts, 'cache', False),
+            getattr(self.opts, 'refresh', False),
+            **InventoryCache.options(argparser.dotrc.get('cache', None))
+        )
+
+    def login(self):
+        """
+        Method logs into vCenter the first time it is called, so commands that
+        can be answered from the inventory cache never have to.
 
-            self.auth = Auth(self.opts.host)
+        Returns:
+            session (obj): ServiceInstance
+        """
+        if not self.auth.session:
             self.auth.login(
                 self.opts.user, self.opts.passwd, self.opts.domain, self.opts.passwd_file
             )
@@ -49,16 +61,341 @@ class VCTools(Logger):
             self.opts.passwd = None
             self.logger.debug(self.opts)
 
+        return self.auth.session
 
-            virtual_machines_container = Query.create_container(
-                self.auth.session, self.auth.session.content.rootFolder,
-                [vim.VirtualMachine], True
+    def logout(self):
+        """ Method logs out of vCenter if a session was opened. """
+        if self.auth and self.auth.session:
+            call_count = self.auth.session.content.sessionManager.currentSession.callCount
+            self.auth.logout()
+            self.logger.debug('Call count: {0}'.format(call_count))
+
+    def container(self, *types):
+        """
+        Method returns a ContainerView of types under rootFolder.  Views are
+        created on first use and reused for the rest of the run.
+
+        Args:
+            types (obj): Managed object types, i.e. vim.VirtualMachine
+        """
+        return ViewManager.for_session(self.login()).view(*types)
+
+    def export_vm_configs(self, configs, output_dir, workers=8):
+        """
+        Method writes VM configs to output_dir as they are retrieved.  The YaML
+        is written by a pool of threads, so files are written while the next
+        configs are built.
+
+        Args:
+            configs (iter):   (name, cfg) tuples, i.e. from Query.vm_configs
+            output_dir (str): Directory for the <name>.yaml files
+            workers (int):    Number of writer threads
+        """
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        def write(cfg):
+            """ Writes a config to a file named after the VM. """
+            filename = os.path.join(output_dir, cfg['vmconfig']['name'] + '.yaml')
+            with open(filename, 'w') as cfg_file:
+                yaml.dump(cfg, cfg_file, default_flow_style=False)
+            return filename
+
+        pool = ThreadPool(workers)
+        try:
+            results = [pool.apply_async(write, (cfg,)) for dummy, cfg in configs]
+            for result in results:
+                self.logger.info(result.get())
+        finally:
+            pool.close()
+            pool.join()
+
+    def query(self):
+        """
+        Method runs every query option.  Rows are written by self.output as
+        they are retrieved, in the format selected with --output.  Inventory
+        queries are answered from the inventory of vctools sync while it is
+        fresh, and otherwise from the cache or vCenter.  The caller closes
+        self.output once the query is done or failed.
+        """
+        synced = None
+        if (self.opts.datastores or self.opts.folders or self.opts.clusters or
+                self.opts.networks or self.opts.vms):
+            synced = SyncedInventory.for_cache(self.cache)
+
+        if self.opts.anti_affinity_rules and self.opts.all_clusters:
+            cluster_rules = Query.anti_affinity_rules(
+                self.container(vim.ClusterComputeResource)
+            )
+            self.output.emit(
+                'anti_affinity_rules', ['cluster', 'rule', 'vms'],
+                (
+                    [cluster, rule, sorted(vms)]
+                    for cluster, rules in sorted(cluster_rules.iteritems())
+                    for rule, vms in sorted(rules.iteritems())
+                ),
+                '{0}: {1}: {2}'
+            )
+        elif self.opts.anti_affinity_rules:
+            if self.opts.cluster:
+                anti_affinity_rules = Query.return_anti_affinity_rules(
+                    self.container(vim.ClusterComputeResource), self.opts.cluster
+                )
+            else:
+                cluster = Prompts.clusters(self.login())
+                anti_affinity_rules = Query.return_anti_affinity_rules(
+                    self.container(vim.ClusterComputeResource), cluster
+                )
+            if not anti_affinity_rules:
+                self.output.text('No antiaffinity rules defined.')
+            else:
+                self.output.text('Antiaffinity rules:')
+
+            self.output.emit(
+                'anti_affinity_rules', ['rule', 'vms'],
+                (
+                    [key, sorted(val)]
+                    for key, val in sorted((anti_affinity_rules or {}).iteritems())
+                ),
+                '{0}: {1}'
             )
 
-            self.vmcfg = VMConfigHelper(self.auth, self.opts, argparser.dotrc)
-            self.clustercfg = ClusterConfig(self.auth, self.opts, argparser.dotrc)
+        if self.opts.datastores and self.opts.all_clusters:
+            datastores = synced.datastores() if synced else self.cache.fetch(
+                'datastores', '', lambda: Query.return_all_datastores(
+                    self.container(vim.ClusterComputeResource)
+                )
+            )
+            self.output.emit(
+                'datastores', Query.datastore_fields + ['clusters'], datastores[1:],
+                '{0:30}\t{1:10}\t{2:10}\t{3:6}\t{4:10}\t{5:6}\t{6}', datastores[0]
+            )
+        elif self.opts.datastores:
+            if self.opts.cluster:
+                cluster = self.opts.cluster
+            else:
+                cluster = Prompts.clusters(self.login())
+            datastores = synced.datastores(cluster) if synced else self.cache.fetch(
+                'datastores', cluster, lambda: Query.return_datastores(
+                    self.container(vim.ClusterComputeResource), cluster
+                )
+            )
+            self.output.emit(
+                'datastores', Query.datastore_fields, datastores[1:],
+                '{0:30}\t{1:10}\t{2:10}\t{3:6}\t{4:10}\t{5:6}', datastores[0]
+            )
 
-            call_count = self.auth.session.content.sessionManager.currentSession.callCount
+        if self.opts.folders:
+            if self.opts.datacenter:
+                datacenter = self.opts.datacenter
+            else:
+                datacenter = Prompts.datacenters(self.login())
+            folders = synced.folders(datacenter) if synced else self.cache.fetch(
+                'folders', datacenter, lambda: Query.list_vm_folders(
+                    self.container(vim.Datacenter), datacenter
+                )
+            )
+            folders.sort()
+            self.output.emit('folders', ['folder'], ([folder] for folder in folders))
+        if self.opts.clusters:
+            clusters = synced.clusters() if synced else self.cache.fetch(
+                'clusters', '', lambda: Query.list_obj_attrs(
+                    self.container(vim.ClusterComputeResource), 'name'
+                )
+            )
+            clusters.sort()
+            self.output.emit('clusters', ['cluster'], ([cluster] for cluster in clusters))
+        if self.opts.networks:
+            if self.opts.cluster:
+                cluster_name = self.opts.cluster
+            else:
+                cluster_name = Prompts.clusters(self.login())
+            networks = synced.networks(cluster_name) if synced else self.cache.fetch(
+                'networks', cluster_name, lambda: Query.list_obj_attrs(
+                    Query.get_obj(
+                        self.container(vim.ClusterComputeResource), cluster_name
+                    ).network, 'name', view=False
+                )
+            )
+            networks.sort()
+            self.output.emit('networks', ['network'], ([net] for net in networks))
+        if self.opts.vms:
+            datacenter = None if self.opts.all_datacenters else self.opts.datacenter
+            scope = ' '.join([datacenter or ''] + self.opts.vm_properties)
+            if synced:
+                vms = synced.vms(datacenter, self.opts.vm_properties)
+            else:
+                vms = self.cache.get('vms', scope)
+            if vms is None:
+                vms = self.cache.stream('vms', scope, Query.list_vm_info(
+                    self.container(vim.Datacenter), datacenter,
+                    self.opts.vm_properties
+                ))
+            self.output.emit('vms', ['name', 'moid'] + self.opts.vm_properties, vms)
+        if self.opts.vmconfig:
+            configs = Query.vm_configs(
+                self.container(vim.VirtualMachine), self.opts.vmconfig,
+                self.opts.createcfg
+            )
+            if self.opts.output_dir:
+                self.export_vm_configs(configs, self.opts.output_dir)
+            elif self.output.fmt == 'text':
+                configs = dict(configs)
+                for name in self.opts.vmconfig:
+                    self.output.text(yaml.dump(configs[name], default_flow_style=False))
+            else:
+                self.output.emit('vmconfig', ['name', 'config'], configs)
+        if self.opts.vm_by_datastore and self.opts.all:
+            if self.opts.cluster:
+                index = Query.datastore_vm_index(
+                    self.container(vim.ClusterComputeResource), self.opts.cluster
+                )
+            else:
+                index = Query.datastore_vm_index(self.container(vim.ComputeResource))
+            if self.output.fmt == 'text':
+                self.output.text(json.dumps(index, indent=4, sort_keys=True))
+            else:
+                self.output.emit(
+                    'vm_by_datastore', ['datastore', 'vms'], sorted(index.iteritems())
+                )
+        elif self.opts.vm_by_datastore:
+            if self.opts.cluster:
+                cluster = self.opts.cluster
+            else:
+                cluster = Prompts.clusters(self.login())
+            if self.opts.datastore:
+                datastore = self.opts.datastore
+            else:
+                datastore = Prompts.datastores(self.login(), cluster)
+                print()
+
+            vms = Query.vm_by_datastore(
+                self.container(vim.ClusterComputeResource), cluster, datastore
+            )
+            self.output.emit(
+                'vm_by_datastore', ['datastore', 'vm'], ([datastore, vm] for vm in vms),
+                '{1}'
+            )
+
+        if self.opts.vm_guest_ids:
+            self.output.emit(
+                'vm_guest_ids', ['guestId'], ([guest_id] for guest_id in Query.list_guestids())
+            )
+
+    def query_hosts(self):
+        """
+        Method runs the query options on every vCenter of opts.hosts at the
+        same time, each in its own thread with its own session.  The password
+        is asked for once, and rows are tagged with their vCenter.
+
+        If any vCenter fails, the others still finish before vctools exits
+        with status 3.
+        """
+        # prompts can't be answered for several vCenters at once
+        opts = self.opts
+        cluster_options = [
+            opts.networks,
+            opts.datastores and not opts.all_clusters,
+            opts.anti_affinity_rules and not opts.all_clusters,
+            opts.vm_by_datastore and not opts.all,
+        ]
+        if any(cluster_options) and not opts.cluster:
+            raise ValueError('--cluster is required when querying several vCenters')
+        if opts.vm_by_datastore and not opts.all and not opts.datastore:
+            raise ValueError('--datastore is required when querying several vCenters')
+
+        if not opts.passwd:
+            if opts.passwd_file:
+                opts.passwd = Auth.decrypt_gpg_file(opts.passwd_file)
+            else:
+                opts.passwd = getpass()
+
+        def run(host):
+            """ Runs the query options on host. """
+            host_vct = VCTools(copy.copy(opts))
+            host_vct.opts.host = host
+            host_vct.output = self.output.tagged(host)
+            host_vct.connect(host)
+            try:
+                host_vct.query()
+            finally:
+                host_vct.output.close()
+                host_vct.logout()
+
+        pool = ThreadPool(len(opts.hosts))
+        try:
+            results = [(host, pool.apply_async(run, (host,))) for host in opts.hosts]
+            failed = False
+            for host, result in results:
+                try:
+                    result.get()
+                except Exception as err: # pylint: disable=broad-except
+                    # one vCenter failing must not lose the rows of the others
+                    self.logger.error('%s %s', host, getattr(err, 'msg', None) or err)
+                    self.logger.debug('%s traceback', host, exc_info=True)
+                    failed = True
+        finally:
+            opts.passwd = None
+            pool.close()
+            pool.join()
+
+        if failed:
+            sys.exit(3)
+
+    def bulk(self, wrapper, *args):
+        """
+        Method runs a wrapper of VMConfigHelper for every VM in opts.name.
+        With --workers, the VMs are split across processes that log in with a
+        clone of this session.
+
+        Args:
+            wrapper (str): Name of the VMConfigHelper method, i.e. power_wrapper
+            args (tuple):  Arguments of the wrapper before the names of VMs
+        """
+        names = list(self.opts.name or [])
+
+        if self.opts.workers < 2 or len(names) < 2:
+            getattr(self.vmcfg, wrapper)(*(args + tuple(names)))
+            return
+
+        def run(auth, chunk):
+            """ Runs the wrapper with the session of a worker. """
+            vmcfg = VMConfigHelper(auth, self.opts, argparser.dotrc)
+            getattr(vmcfg, wrapper)(*(args + tuple(chunk)))
+
+        failed = []
+        for chunk, error in CloneExecutor(self.auth, self.opts.workers).run(run, names):
+            if error:
+                self.logger.error('%s %s', ' '.join(chunk), error, exc_info=False)
+                failed.extend(chunk)
+
+        if failed:
+            raise ValueError('%s failed: %s' % (wrapper, ' '.join(failed)))
+
+    def main(self):
+        """
+        This is the main method, which parses all the argparse options and runs
+        the necessary code blocks if True.
+        """
+
+        try:
+
+            self.output = Output(self.opts.output)
+
+            # the output is closed even if a query fails, so json stays valid
+            if self.opts.cmd == 'query' and len(self.opts.hosts) > 1:
+                try:
+                    self.query_hosts()
+                finally:
+                    self.output.close()
+                return
+
+            self.connect(self.opts.host)
+
+            if self.opts.cmd not in ('query', 'sync'):
+                self.login()
+                self.vmcfg = VMConfigHelper(self.auth, self.opts, argparser.dotrc)
+                self.clustercfg = ClusterConfig(self.auth, self.opts, argparser.dotrc)
 
             if self.opts.cmd == 'create':
                 if self.opts.config:
@@ -70,6 +407,7 @@ class VCTools(Logger):
                         )
                         spec = self.vmcfg.pre_create_hooks(**spec)
                         spec = self.vmcfg.create_wrapper(**spec)
+                        self.cache.invalidate('vms', 'datastores')
                         self.vmcfg.post_create_hooks(**spec)
                         filename = spec['vmconfig']['name'] + '.yaml'
                         server_cfg = {}
@@ -83,30 +421,41 @@ class VCTools(Logger):
                             file=open(filename, 'w')
                         )
 
+            # the VMs that succeeded changed even if others failed
             if self.opts.cmd == 'mount':
-                self.vmcfg.mount_wrapper(self.opts.datastore, self.opts.path, *self.opts.name)
+                try:
+                    self.bulk('mount_wrapper', self.opts.datastore, self.opts.path)
+                finally:
+                    self.cache.invalidate('vmconfig')
 
             if self.opts.cmd == 'power':
-                self.vmcfg.power_wrapper(self.opts.power, *self.opts.name)
+                try:
+                    self.bulk('power_wrapper', self.opts.power)
+                finally:
+                    self.cache.invalidate('vms')
 
             if self.opts.cmd == 'umount':
-                self.vmcfg.umount_wrapper(*self.opts.name)
+                try:
+                    self.bulk('umount_wrapper')
+                finally:
+                    self.cache.invalidate('vmconfig')
 
             if self.opts.cmd == 'upload':
                 self.vmcfg.upload_wrapper(
                     self.opts.datastore, self.opts.dest,
                     self.opts.verify_ssl, *self.opts.iso
                 )
+                self.cache.invalidate('datastores')
 
             if self.opts.cmd == 'add':
-                hostname = Query.get_obj(virtual_machines_container.view, self.opts.name)
+                hostname = Query.get_obj(self.container(vim.VirtualMachine), self.opts.name)
 
                 # nics
                 if self.opts.device == 'nic':
                     self.vmcfg.add_nic_recfg(hostname)
 
             if self.opts.cmd == 'reconfig':
-                host = Query.get_obj(virtual_machines_container.view, self.opts.name)
+                host = Query.get_obj(self.container(vim.VirtualMachine), self.opts.name)
                 if self.opts.cfgs:
                     self.logger.info(
                         'reconfig: %s cfgs: %s', host.name,
@@ -119,137 +468,27 @@ class VCTools(Logger):
                     self.vmcfg.disk_recfg()
                 if self.opts.device == 'nic':
                     self.vmcfg.nic_recfg()
+                self.cache.invalidate('vms', 'datastores', 'vmconfig')
 
             if self.opts.cmd == 'drs':
                 if not self.opts.cluster:
                     self.opts.cluster = Prompts.clusters(self.auth.session)
                 self.clustercfg.drs_rule()
 
-            if self.opts.cmd == 'query':
-                datacenters_container = Query.create_container(
-                    self.auth.session, self.auth.session.content.rootFolder,
-                    [vim.Datacenter], True
-                )
-                clusters_container = Query.create_container(
-                    self.auth.session, self.auth.session.content.rootFolder,
-                    [vim.ClusterComputeResource], True
-                )
+            if self.opts.cmd == 'sync':
+                InventorySync(self.login(), self.cache).sync(self.opts.loop, self.opts.wait)
 
-                if self.opts.anti_affinity_rules:
-                    if self.opts.cluster:
-                        anti_affinity_rules = Query.return_anti_affinity_rules(
-                            clusters_container.view, self.opts.cluster
-                        )
-                    else:
-                        cluster = Prompts.clusters(self.auth.session)
-                        anti_affinity_rules = Query.return_anti_affinity_rules(
-                            clusters_container.view, cluster
-                        )
-                    if not anti_affinity_rules:
-                        print('No antiaffinity rules defined.')
-                    else:
-                        print('Antiaffinity rules:')
-
-                        for key, val in sorted(anti_affinity_rules.iteritems()):
-                            print('{0}: {1}'.format(key, ' '.join(sorted(val))))
-
-                if self.opts.datastores:
-                    if self.opts.cluster:
-                        datastores = Query.return_datastores(
-                            clusters_container.view, self.opts.cluster
-                        )
-                    else:
-                        cluster = Prompts.clusters(self.auth.session)
-                        datastores = Query.return_datastores(clusters_container.view, cluster)
-                    for row in datastores:
-                        print('{0:30}\t{1:10}\t{2:10}\t{3:6}\t{4:10}\t{5:6}'.format(*row))
-
-                if self.opts.folders:
-                    if self.opts.datacenter:
-                        folders = Query.list_vm_folders(
-                            datacenters_container.view, self.opts.datacenter
-                        )
-                        folders.sort()
-                        for folder in folders:
-                            print(folder)
-                    else:
-                        datacenter = Prompts.datacenters(self.auth.session)
-                        folders = Query.list_vm_folders(datacenters_container.view, datacenter)
-                        folders.sort()
-                        for folder in folders:
-                            print(folder)
-                if self.opts.clusters:
-                    clusters = Query.list_obj_attrs(clusters_container, 'name')
-                    clusters.sort()
-                    for cluster in clusters:
-                        print(cluster)
-                if self.opts.networks:
-                    if self.opts.cluster:
-                        cluster = Query.get_obj(clusters_container.view, self.opts.cluster)
-                        networks = Query.list_obj_attrs(cluster.network, 'name', view=False)
-                        networks.sort()
-                        for net in networks:
-                            print(net)
-                    else:
-                        cluster_name = Prompts.clusters(self.auth.session)
-                        cluster = Query.get_obj(clusters_container.view, cluster_name)
-                        networks = Query.list_obj_attrs(cluster.network, 'name', view=False)
-                        networks.sort()
-                        for net in networks:
-                            print(net)
-                if self.opts.vms:
-                    vms = Query.list_vm_info(datacenters_container.view, self.opts.datacenter)
-                    for key, value in vms.iteritems():
-                        print(key, value)
-                if self.opts.vmconfig:
-                    for name in self.opts.vmconfig:
-                        virtmachine = Query.get_obj(virtual_machines_container.view, name)
-                        self.logger.debug(virtmachine.config)
-                        if self.opts.createcfg:
-                            print(
-                                yaml.dump(
-                                    Query.vm_config(
-                                        virtual_machines_container.view, name, self.opts.createcfg
-                                    ),
-                                    default_flow_style=False
-                                )
-                            )
-                        else:
-                            print(
-                                yaml.dump(
-                                    Query.vm_config(virtual_machines_container.view, name),
-                                    default_flow_style=False
-                                )
-                            )
-                if self.opts.vm_by_datastore:
-                    if self.opts.cluster and self.opts.datastore:
-                        vms = Query.vm_by_datastore(
-                            clusters_container.view, self.opts.cluster, self.opts.datastore
-                        )
-                        for vm_name in vms:
-                            print(vm_name)
-                    else:
-                        if not self.opts.cluster:
-                            cluster = Prompts.clusters(self.auth.session)
-                        if not self.opts.datastore:
-                            datastore = Prompts.datastores(self.auth.session, cluster)
-                        print()
-
-                        vms = Query.vm_by_datastore(clusters_container.view, cluster, datastore)
-                        for vm_name in vms:
-                            print(vm_name)
-
-                if self.opts.vm_guest_ids:
-                    for guest_id in Query.list_guestids():
-                        print(guest_id)
+            if self.opts.cmd == 'query':
+                try:
+                    self.query()
+                finally:
+                    self.output.close()
 
-            self.auth.logout()
-            self.logger.debug('Call count: {0}'.format(call_count))
+            self.logout()
 
         except ValueError as err:
             self.logger.error(err, exc_info=False)
-            self.auth.logout()
-            self.logger.debug('Call count: {0}'.format(call_count))
+            self.logout()
             sys.exit(3)
 
         except vim.fault.InvalidLogin as loginerr:
@@ -258,8 +497,7 @@ class VCTools(Logger):
 
         except KeyboardInterrupt as err:
             self.logger.error(err, exc_info=False)
-            self.auth.logout()
-            self.logger.debug('Call count: {0}'.format(call_count))
+            self.logout()
             sys.exit(1)
 
 
@@ -294,5 +532,42 @@ if __name__ == '__main__':
     for handler in logging.root.handlers:
         handler.addFilter(AddFilter())
 
+    # imported once the arguments are parsed, so --help and --version don't
+    # wait for pyVmomi and requests
+    # pylint: disable=wrong-import-position,ungrouped-imports
+    from multiprocessing.pool import ThreadPool
+    from pyVmomi import vim # pylint: disable=no-name-in-module
+    from vctools.auth import Auth
+    from vctools.cache import InventoryCache
+    from vctools.executor import CloneExecutor
+    from vctools.output import Output
+    from vctools.vmconfig_helper import VMConfigHelper
+    from vctools.clusterconfig import ClusterConfig
+    from vctools.prompts import Prompts
+    from vctools.query import Query
+    from vctools.cfgchecker import CfgCheck
+    from vctools.sync import InventorySync, SyncedInventory
+    from vctools.views import ViewManager
+
+    stats = None
+    if options.stats or options.stats_file:
+        from vctools.stats import RpcStats
+        stats = RpcStats(options.stats_file).install()
+
+    profiler = None
+    if options.profile:
+        from vctools.profiler import Profiler
+        profiler = Profiler(options.profile, options.profile_top)
+
     vct = VCTools(options)
-    sys.exit(vct.main())
+    try:
+        if profiler:
+            sys.exit(profiler.run(vct.main))
+        sys.exit(vct.main())
+    finally:
+        if stats:
+            stats.uninstall()
+            if options.stats:
+                stats.summary(sys.stderr)
+        if profiler:
+            profiler.report(sys.stderr)
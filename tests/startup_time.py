@@ -0,0 +1,120 @@
+#!/usr/bin/python
+""" Benchmark the startup time of the CLI """
+from __future__ import print_function
+import os
+import runpy
+import subprocess
+import sys
+import time
+
+class StartupTime(object):
+    """ Times commands that should return without loading pyVmomi """
+    # modules only needed once a command talks to vCenter
+    deferred = ['pyVmomi', 'pyVim', 'requests']
+
+    def __init__(self, runs=5, limit=1.0):
+        """
+        runs (int) Number of times each command is run
+        limit (float) Max seconds of the median run
+        """
+        self.runs = runs
+        self.limit = limit
+        self.rootdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.main_py = os.path.join(self.rootdir, 'main.py')
+
+    def median(self, args):
+        """
+        Run main.py with args and time it
+
+        args (list) Arguments of main.py
+
+        Returns
+            median (float) Median seconds of the runs
+
+        Raises
+            RuntimeError if main.py exits with a non-zero status
+        """
+        timings = []
+        with open(os.devnull, 'w') as devnull:
+            for dummy in range(self.runs):
+                start = time.time()
+                proc = subprocess.Popen(
+                    [sys.executable, self.main_py] + args, stdout=devnull,
+                    stderr=subprocess.PIPE
+                )
+                dummy, stderr = proc.communicate()
+                timings.append(time.time() - start)
+                if proc.returncode != 0:
+                    raise RuntimeError('{0} exits with {1}\n{2}'.format(
+                        ' '.join(args), proc.returncode, stderr.strip()
+                    ))
+
+        return sorted(timings)[len(timings) // 2]
+
+    def loaded(self, args):
+        """
+        Parse args like main.py does
+
+        args (list) Arguments of main.py
+
+        Returns
+            modules (list) Deferred modules that were imported anyway
+
+        Raises
+            RuntimeError if main.py exits with a non-zero status or raises
+        """
+        argv = sys.argv
+        stdout = sys.stdout
+        sys.argv = [self.main_py] + args
+        sys.path.insert(0, self.rootdir)
+        try:
+            with open(os.devnull, 'w') as devnull:
+                sys.stdout = devnull
+                runpy.run_path(self.main_py, run_name='__main__')
+        except SystemExit as err:
+            if err.code:
+                raise RuntimeError('{0} exits with {1}'.format(' '.join(args), err.code))
+        except Exception as err: # pylint: disable=broad-except
+            raise RuntimeError('{0} raises {1}: {2}'.format(
+                ' '.join(args), type(err).__name__, err
+            ))
+        finally:
+            sys.argv = argv
+            sys.stdout = stdout
+            sys.path.remove(self.rootdir)
+
+        return [module for module in self.deferred if module in sys.modules]
+
+    def main(self):
+        """
+        Print the startup time of each command and exit accordingly:
+
+          exit 0 success
+          exit 1 fail
+        """
+        errors = []
+        for args in (['--version'], ['--help'], ['query', '--help']):
+            try:
+                median = self.median(args)
+            except RuntimeError as err:
+                errors.append(str(err))
+                continue
+            print('{0:<20} {1:.3f}s'.format(' '.join(args), median))
+            if median > self.limit:
+                errors.append('{0} exceeds {1}s'.format(' '.join(args), self.limit))
+
+        try:
+            modules = self.loaded(['--help'])
+            if modules:
+                errors.append('--help imports {0}'.format(' '.join(modules)))
+        except RuntimeError as err:
+            errors.append(str(err))
+
+        if errors:
+            print('errors:\n{0}'.format('\n'.join(errors)))
+            sys.exit(1)
+        sys.exit(0)
+
+if __name__ == '__main__':
+    startup = StartupTime(limit=float(sys.argv[1]) if len(sys.argv) > 1 else 1.0)
+    sys.exit(startup.main())
@@ -0,0 +1,54 @@
+#!/usr/bin/python
+""" Tests of the inventory cache and the synced inventory """
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from vctools.cache import InventoryCache
+from vctools.sync import SyncedInventory
+
+class SyncedInventoryTest(unittest.TestCase):
+    """ The synced inventory is only read until vctools changes the inventory """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = InventoryCache('vcenter', path=os.path.join(self.tmpdir, 'inventory.db'))
+        self.cache.apply_updates('session[1]pc', '1', [
+            ('enter', 'datacenter-1', 'Datacenter', {'name': 'dc', 'vmFolder': 'group-v1'}, []),
+            ('enter', 'group-v1', 'Folder', {'name': 'vm', 'parent': 'datacenter-1'}, []),
+            (
+                'enter', 'vm-1', 'VirtualMachine',
+                {'name': 'web01', 'parent': 'group-v1', 'runtime.powerState': 'poweredOn'}, []
+            ),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_fresh(self):
+        """ A fresh sync answers queries """
+        synced = SyncedInventory.for_cache(self.cache)
+        self.assertEqual(synced.vms('dc', ['power']), [['web01', 'vm-1', 'poweredOn']])
+
+    def test_invalidate(self):
+        """ A change made by vctools, i.e. power, makes the sync stale """
+        self.cache.invalidate('vms')
+        self.assertIsNone(self.cache.sync_age())
+        self.assertIsNone(SyncedInventory.for_cache(self.cache))
+
+    def test_sync_after_invalidate(self):
+        """ The next sync makes the inventory fresh again """
+        self.cache.invalidate('vms')
+        self.cache.apply_updates('session[1]pc', '2', [
+            ('modify', 'vm-1', 'VirtualMachine', {'runtime.powerState': 'poweredOff'}, []),
+        ])
+        synced = SyncedInventory.for_cache(self.cache)
+        self.assertEqual(synced.vms('dc', ['power']), [['web01', 'vm-1', 'poweredOff']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+""" Tests of the query output formats """
+import json
+import os
+import sys
+import unittest
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from vctools.output import Output
+
+class OutputTest(unittest.TestCase):
+    """ Names from pyVmomi are unicode, and may not be ASCII """
+    def emit(self, fmt, rows, vcenter=None):
+        """ Returns what Output writes for rows. """
+        stream = StringIO()
+        output = Output(fmt, stream)
+        if vcenter:
+            output = output.tagged(vcenter)
+        output.emit('vms', ['name', 'moid'], rows)
+        output.close()
+        return stream.getvalue()
+
+    def test_text(self):
+        """ Text output writes non-ASCII names as UTF-8 """
+        self.assertEqual(self.emit('text', [[u'caf\xe9', 'vm-1']]), 'café vm-1\n')
+
+    def test_text_vcenter(self):
+        """ Rows tagged with their vCenter write non-ASCII names too """
+        self.assertEqual(
+            self.emit('text', [[u'caf\xe9', 'vm-1']], 'vcenter'), 'vcenter\tcafé vm-1\n'
+        )
+
+    def test_text_list(self):
+        """ Lists of non-ASCII names are joined """
+        self.assertEqual(self.emit('text', [[[u'caf\xe9', u'th\xe9'], 'vm-1']]), 'café thé vm-1\n')
+
+    def test_csv(self):
+        """ csv output writes non-ASCII names as UTF-8 """
+        self.assertEqual(self.emit('csv', [[u'caf\xe9', 'vm-1']]), 'name,moid\r\ncafé,vm-1\r\n')
+
+    def test_json_failed_rows(self):
+        """ json stays valid when the rows of a section fail halfway """
+        def rows():
+            """ Yields a row, then fails like a query of a missing cluster. """
+            yield ['web01', 'vm-1']
+            raise ValueError('cluster not found.')
+
+        stream = StringIO()
+        output = Output('json', stream)
+        output.emit('clusters', ['name'], [['cluster']])
+        try:
+            output.emit('vms', ['name', 'moid'], rows())
+        except ValueError:
+            pass
+        finally:
+            output.close()
+
+        self.assertEqual(json.loads(stream.getvalue()), {
+            'clusters': [{'name': 'cluster'}], 'vms': [{'name': 'web01', 'moid': 'vm-1'}]
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
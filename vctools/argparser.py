@@ -9,18 +9,24 @@ import textwrap
 import yaml
 from vctools import Logger
 
+class GitVersion(argparse.Action):
+    """
+    Action prints the git revision of vctools.  git is only run when --version
+    is passed, instead of every time the parser is built.
+    """
+    def __init__(self, option_strings, **kwargs):
+        kwargs.update(nargs=0, dest=argparse.SUPPRESS, default=argparse.SUPPRESS)
+        super(GitVersion, self).__init__(option_strings, **kwargs)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        parser.exit(message=ArgParser.version())
+
+
 # pylint: disable=too-many-instance-attributes
 class ArgParser(Logger):
     """Argparser class. It handles the user inputs and config files."""
     def __init__(self):
         self.syspath = sys.path[0]
-        self.gitrev = subprocess.check_output(
-            [
-                'git', '--git-dir', self.syspath + '/.git', 'rev-parse', '--short', 'HEAD'
-            ]
-        )
-
-        self.__version__ = self.gitrev
         self.help = None
         self.opts = None
         self.dotrc = None
@@ -30,8 +36,7 @@ class ArgParser(Logger):
         )
 
         self.parser.add_argument(
-            '--version', '-v', action='version',
-            version=self.__version__,
+            '--version', '-v', action=GitVersion,
             help='version number'
         )
 
@@ -42,14 +47,22 @@ class ArgParser(Logger):
         rc_files = [rootdir + '/vctoolsrc.yaml', '~/.vctoolsrc.yaml']
         for rc_file in rc_files:
             try:
-                dotrc_yaml = open(os.path.expanduser(rc_file))
-                self.dotrc = yaml.load(dotrc_yaml)
+                with open(os.path.expanduser(rc_file)) as dotrc_yaml:
+                    # the libyaml loader is much faster, if PyYAML was built with it
+                    self.dotrc = yaml.load(dotrc_yaml, Loader=getattr(yaml, 'CLoader', yaml.Loader))
             except IOError:
                 pass
 
         if not self.dotrc:
             raise ValueError('Cannot load dotrc file.')
 
+    @classmethod
+    def version(cls):
+        """ Returns the short git revision of vctools. """
+        return subprocess.check_output(
+            ['git', '--git-dir', sys.path[0] + '/.git', 'rev-parse', '--short', 'HEAD']
+        )
+
     @staticmethod
     def _mkdict(args):
         """
@@ -83,7 +96,8 @@ class ArgParser(Logger):
         # positional argument
         general_parser.add_argument(
             'host',
-            help='vCenter host'
+            help='vCenter host. query also accepts comma separated hosts, or '
+                 'the name of a hostgroup in the dotrc file.'
         )
 
         genopts = general_parser.add_argument_group('general options')
@@ -107,6 +121,18 @@ class ArgParser(Logger):
             '--passwd', metavar='',
             help='password'
         )
+
+        genopts.add_argument(
+            '--session-cache', action='store_true',
+            help='reuse the vCenter session of the previous run, kept in '
+                 '~/.cache/vctools/sessions'
+        )
+
+        genopts.add_argument(
+            '--output', metavar='', choices=['text', 'json', 'ndjson', 'csv'],
+            default='text',
+            help='query output format choices=[%(choices)s] default: %(default)s'
+        )
         if defaults:
             general_parser.set_defaults(**defaults)
 
@@ -144,6 +170,40 @@ class ArgParser(Logger):
 
         return logging_parser
 
+    @classmethod
+    def diagnostics(cls, **defaults):
+        """ Diagnostics Parser """
+        # diagnostics (parent)
+        diagnostics_parser = argparse.ArgumentParser(add_help=False)
+
+        diagnostics_opts = diagnostics_parser.add_argument_group('diagnostics options')
+
+        diagnostics_opts.add_argument(
+            '--stats', action='store_true',
+            help='print the SOAP calls made to vCenter by method and type at exit'
+        )
+
+        diagnostics_opts.add_argument(
+            '--stats-file', metavar='',
+            help='append every SOAP call to a file as one JSON object per line'
+        )
+
+        diagnostics_opts.add_argument(
+            '--profile', nargs='?', const='vctools.pstats', metavar='',
+            help='profile the command, write the stats to a file and summarise '
+                 'them at exit default: %(const)s'
+        )
+
+        diagnostics_opts.add_argument(
+            '--profile-top', type=int, default=20, metavar='',
+            help='number of functions in the profile summary default: %(default)s'
+        )
+
+        if defaults:
+            diagnostics_parser.set_defaults(**defaults)
+
+        return diagnostics_parser
+
     def add(self, *parents, **defaults):
         """ Add Hardware to Virtual Machines """
         # add
@@ -252,6 +312,12 @@ class ArgParser(Logger):
             help='name attribute of Virtual Machine object.'
         )
 
+        mount_parser.add_argument(
+            '--workers', type=int, default=1, metavar='',
+            help='number of processes that share the VMs, each with its own '
+                 'session default: %(default)s'
+        )
+
         if defaults:
             mount_parser.set_defaults(**defaults)
 
@@ -276,6 +342,12 @@ class ArgParser(Logger):
             help='name attribute of Virtual Machine object.'
         )
 
+        power_parser.add_argument(
+            '--workers', type=int, default=1, metavar='',
+            help='number of processes that share the VMs, each with its own '
+                 'session default: %(default)s'
+        )
+
         if defaults:
             power_parser.set_defaults(**defaults)
 
@@ -331,11 +403,21 @@ class ArgParser(Logger):
             help='vCenter ComputeResource.'
         )
 
+        query_opts.add_argument(
+            '--all-clusters', action='store_true',
+            help='Query every cluster at once instead of --cluster.'
+        )
+
         query_opts.add_argument(
             '--datacenter', metavar='', default='Linux',
             help='vCenter Datacenter. default: %(default)s'
         )
 
+        query_opts.add_argument(
+            '--all-datacenters', action='store_true',
+            help='Query every datacenter at once instead of --datacenter.'
+        )
+
         query_opts.add_argument(
             '--vmconfig', nargs='+', metavar='',
             help='Virtual machine config'
@@ -345,18 +427,50 @@ class ArgParser(Logger):
             '--vm-by-datastore', action='store_true',
             help='List the VMs associated with datastore.'
         )
+        query_opts.add_argument(
+            '--all', action='store_true',
+            help='With --vm-by-datastore, print the VMs of every datastore of '
+                 '--cluster, or of the whole vCenter, as JSON.'
+        )
         query_opts.add_argument(
             '--vm-guest-ids', action='store_true',
             help='Show all vm guest ids.'
         )
 
+        query_vms_opts = query_parser.add_argument_group('vms options')
+
+        query_vms_opts.add_argument(
+            '--vm-properties', nargs='+', metavar='', default=[],
+            choices=['power', 'host', 'ip', 'guestId'],
+            help='Extra columns for --vms: power, host, ip and guestId'
+        )
+
         query_vmcfg_opts = query_parser.add_argument_group('vmconfig options')
 
         query_vmcfg_opts.add_argument(
             '--createcfg', metavar='',
-            help='Create a build config from --vmconfig spec.'
+            help='Create a build config from --vmconfig spec. {name} is replaced '
+                 'with the name of each VM, i.e. {name}-copy, and is required '
+                 'for more than one VM'
         )
 
+        query_vmcfg_opts.add_argument(
+            '--output-dir', metavar='',
+            help='Write each --vmconfig spec to <name>.yaml inside this directory.'
+        )
+
+        query_cache_opts = query_parser.add_argument_group('cache options')
+
+        query_cache_opts.add_argument(
+            '--cache', action='store_true',
+            help='Answer clusters, datastores, folders, networks and vms from the '
+                 'local inventory cache while it is fresh.'
+        )
+
+        query_cache_opts.add_argument(
+            '--refresh', action='store_true',
+            help='Ignore the local inventory cache and update it from vCenter.'
+        )
 
         if defaults:
             query_parser.set_defaults(**defaults)
@@ -417,7 +531,8 @@ class ArgParser(Logger):
 
         reconfig_type_opts.add_argument(
             '--folder', metavar='', type=str,
-            help='Move the VM to another folder. It must exist. '
+            help='Move the VM to another folder. It must exist. Nested folders '
+                 'are given as a path, i.e. Linux Team/web'
         )
 
         reconfig_disk_opts = reconfig_parser.add_argument_group('disk options')
@@ -457,6 +572,41 @@ class ArgParser(Logger):
         if defaults:
             reconfig_parser.set_defaults(**defaults)
 
+    def sync(self, *parents, **defaults):
+        """ Sync Parser """
+        # sync
+        usage = """
+
+        help: vctools sync -h
+
+        # apply inventory changes since the last sync, i.e. from cron
+        vctools sync <vc>
+
+        # keep applying inventory changes until interrupted
+        vctools sync <vc> --loop
+        """
+        sync_parser = self.subparsers.add_parser(
+            'sync', parents=list(parents),
+            formatter_class=argparse.RawDescriptionHelpFormatter,
+            usage=textwrap.dedent(usage),
+            help='Sync the local inventory cache'
+        )
+
+        sync_parser.set_defaults(cmd='sync')
+
+        sync_parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep waiting for inventory changes until interrupted.'
+        )
+
+        sync_parser.add_argument(
+            '--wait', metavar='', type=int, default=60,
+            help='Seconds to wait for changes per request in a loop. default: %(default)s'
+        )
+
+        if defaults:
+            sync_parser.set_defaults(**defaults)
+
     def umount(self, *parents, **defaults):
         """ Umount Parser """
         # umount
@@ -471,6 +621,12 @@ class ArgParser(Logger):
             '--name', nargs='+',
             help='name attribute of Virtual Machine object.'
         )
+
+        umount_parser.add_argument(
+            '--workers', type=int, default=1, metavar='',
+            help='number of processes that share the VMs, each with its own '
+                 'session default: %(default)s'
+        )
         if defaults:
             umount_parser.set_defaults(**defaults)
 
@@ -602,6 +758,47 @@ class ArgParser(Logger):
             if opts.verify_ssl:
                 opts.verify_ssl = bool(self.dotrc['upload']['verify_ssl'])
 
+        # createcfg is a template for the names of the build configs, which
+        # are also the names of the files written by --output-dir
+        if opts.cmd == 'query' and opts.createcfg:
+            try:
+                names = set(
+                    opts.createcfg.format(name=name) for name in ('vm1', 'vm2')
+                )
+            except (KeyError, IndexError, ValueError) as err:
+                self.parser.error(
+                    '--createcfg {0} is not a valid name template: {1}'.format(
+                        opts.createcfg, err
+                    )
+                )
+            if len(names) == 1 and len(set(opts.vmconfig or [])) > 1:
+                self.parser.error(
+                    '--createcfg must include {name} when more than one VM is given'
+                )
+
+        # csv has a single header, so only one query option can be written
+        if opts.cmd == 'query' and opts.output == 'csv':
+            sections = [
+                opts.anti_affinity_rules, opts.datastores, opts.folders, opts.clusters,
+                opts.networks, opts.vms, opts.vmconfig and not opts.output_dir,
+                opts.vm_by_datastore, opts.vm_guest_ids,
+            ]
+            if len([section for section in sections if section]) > 1:
+                self.parser.error('--output csv takes one query option at a time')
+
+        # query can run on several vCenters, listed with commas or as a
+        # hostgroup in the dotrc file
+        hostgroups = self.dotrc.get('hostgroups', None) or {}
+        if opts.host in hostgroups:
+            opts.hosts = list(hostgroups[opts.host])
+        else:
+            opts.hosts = [host for host in opts.host.split(',') if host]
+
+        if len(opts.hosts) > 1 and opts.cmd != 'query':
+            self.parser.error('only query accepts more than one vCenter host')
+        elif len(opts.hosts) == 1:
+            opts.host = opts.hosts[0]
+
         return opts
 
     def setup_args(self, **dotrc):
@@ -612,11 +809,11 @@ class ArgParser(Logger):
             dotrc (dict): A config file of overrides
         """
 
-        parent_parsers = ['general', 'logging']
+        parent_parsers = ['general', 'logging', 'diagnostics']
         parents = []
 
         subparsers = ['add', 'create', 'drs', 'mount', 'power', 'query', 'reconfig',
-                      'umount', 'upload']
+                      'sync', 'umount', 'upload']
 
         try:
             # load parsers using defaults
@@ -2,30 +2,48 @@
 """Authentication Class for vctools."""
 # vim: ts=4 sw=4 et
 from __future__ import print_function
+from collections import deque
+from contextlib import contextmanager
+import json
 import os
 import subprocess
+import threading
+import time
 from getpass import getpass, getuser
 import ssl
 import requests
 from pyVim.connect import SmartConnect, Disconnect
-from pyVmomi import vim # pylint: disable=E0611
+from pyVmomi import vim, SoapStubAdapter # pylint: disable=E0611
+from vctools.views import ViewManager
 from vctools import Logger
 
 # disable SSL warnings
 requests.packages.urllib3.disable_warnings()
 
 class Auth(Logger):
-    """Authentication Class."""
-    def __init__(self, host=None, port=443):
+    """
+    Authentication Class.
+
+    With reuse, the session cookie is kept in a file only readable by the
+    user, and the next login to the same vCenter attaches to that session
+    instead of logging in again, as long as vCenter still knows it.  The
+    session is not disconnected at logout, so it can be reused.
+    """
+    session_dir = '~/.cache/vctools/sessions'
+
+    def __init__(self, host=None, port=443, reuse=False):
         """
         Args:
-            host (str): This string is the vSphere host host.
-            port (int): Port to connect to host.
+            host (str):   This string is the vSphere host host.
+            port (int):   Port to connect to host.
+            reuse (bool): Reuse the session of a previous run.
         """
         self.host = host
         self.port = port
+        self.reuse = reuse
         self.session = None
         self.ticket = None
+        self.verify_ssl = True
 
 
     @classmethod
@@ -46,6 +64,122 @@ class Auth(Logger):
 
         return output
 
+    def session_file(self):
+        """ Returns the path of the file that keeps the session of host. """
+        return os.path.join(
+            os.path.expanduser(self.session_dir), '{0}_{1}.json'.format(self.host, self.port)
+        )
+
+    def save_session(self, user):
+        """
+        Writes the cookie of the current session to the session file, which
+        is created with permissions for the user only.
+
+        Args:
+            user (str): Username the session belongs to
+        """
+        path = self.session_file()
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), 0o700)
+
+        fdesc = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fdesc, 0o600)
+        with os.fdopen(fdesc, 'w') as session_file:
+            json.dump(
+                {
+                    'user': user,
+                    'cookie': self.session._stub.cookie,
+                    'version': self.session._stub.version,
+                    'verify_ssl': self.verify_ssl,
+                },
+                session_file
+            )
+
+        self.logger.debug('%s session saved', self.host)
+
+    def resume_session(self, user):
+        """
+        Attaches to the session in the session file if it belongs to user and
+        vCenter still considers it logged in.  A session that has expired is
+        forgotten.
+
+        Args:
+            user (str): Username the session must belong to
+
+        Returns:
+            resumed (bool): True if the session was attached
+        """
+        path = self.session_file()
+        try:
+            with open(path) as session_file:
+                saved = json.load(session_file)
+        except (IOError, ValueError):
+            return False
+
+        if saved.get('user', None) != user:
+            return False
+
+        session = self.service_instance(saved['version'], saved.get('verify_ssl', True))
+        session._stub.cookie = str(saved['cookie'])
+
+        try:
+            current = session.content.sessionManager.currentSession
+        except (vim.fault.NotAuthenticated, IOError):
+            current = None
+
+        if not current:
+            self.logger.info('%s saved session expired', self.host)
+            os.remove(path)
+            return False
+
+        self.session = session
+        self.verify_ssl = saved.get('verify_ssl', True)
+        self.logger.info('%s %s session resumed', user, self.host)
+        return True
+
+    def service_instance(self, version, verify_ssl=True):
+        """
+        Returns a ServiceInstance of host that is not logged in.
+
+        Args:
+            version (str):     Version of the stub, i.e. vim.version.version10
+            verify_ssl (bool): False skips verification of the certificate
+        """
+        context = None
+        if not verify_ssl and hasattr(ssl, '_create_unverified_context'):
+            context = ssl._create_unverified_context()
+
+        stub = SoapStubAdapter(
+            host=self.host, port=self.port, version=version, sslContext=context
+        )
+        return vim.ServiceInstance('ServiceInstance', stub)
+
+    def clone_ticket(self):
+        """
+        Returns a ticket another process can log in with, see clone_login.
+        Tickets can only be used once, so the one acquired at login is handed
+        out first and a new one is acquired every time after that.
+        """
+        ticket, self.ticket = self.ticket, None
+        return ticket or self.session.content.sessionManager.AcquireCloneTicket()
+
+    def clone_login(self, ticket, version, verify_ssl=True):
+        """
+        Login to vSphere host with a ticket from clone_ticket, as the same user
+        and without a password.
+
+        Args:
+            ticket (str):      Clone ticket of another session
+            version (str):     Version of the stub of that session
+            verify_ssl (bool): False skips verification of the certificate
+        """
+        session = self.service_instance(version, verify_ssl)
+        session.content.sessionManager.CloneSession(cloneTicket=ticket)
+
+        self.session = session
+        self.verify_ssl = verify_ssl
+        self.logger.info('%s cloned session', self.host)
+
     def login(self, user=None, passwd=None, domain=None, passwd_file=None, sslcontext=None):
         """
         Login to vSphere host
@@ -71,6 +205,9 @@ class Auth(Logger):
             else:
                 user = getuser()
 
+        if self.reuse and self.resume_session(user):
+            return
+
         if not passwd:
             if passwd_file:
                 passwd = self.decrypt_gpg_file(passwd_file)
@@ -99,6 +236,7 @@ class Auth(Logger):
                 self.session = SmartConnect(
                     host=self.host, user=user, pwd=passwd, port=self.port, sslContext=context
                 )
+                self.verify_ssl = False
             else:
                 raise
 
@@ -107,7 +245,165 @@ class Auth(Logger):
             passwd = None
             raise
 
+        if self.reuse and self.session:
+            self.save_session(user)
+
     def logout(self):
-        """Logout of vSphere."""
+        """Logout of vSphere, or leave the session open to be reused."""
+        ViewManager.release(self.session)
+        if self.reuse:
+            self.logger.info('session kept')
+            return
+
         self.logger.info('successful')
         Disconnect(self.session)
+
+
+class SessionPool(Logger):
+    """
+    Class keeps up to size authenticated sessions to one vCenter, so several
+    threads can make calls at the same time instead of queueing on a single
+    SOAP connection.  A session that was idle for longer than check_interval
+    is checked with SessionIsActive before it is handed out, and replaced by a
+    new login if vCenter has expired it.
+
+        pool = SessionPool('vcenter', 4, user='user', passwd_file='~/.pass.asc')
+        with pool.session() as session:
+            Query.list_vm_info(...)
+    """
+    def __init__(self, host, size=4, port=443, check_interval=60, **credentials):
+        """
+        Args:
+            host (str):           vCenter host
+            size (int):           Maximum number of sessions
+            port (int):           Port to connect to host
+            check_interval (int): Seconds a session can be idle before it is
+                checked again
+            credentials (dict):   Keyword arguments of Auth.login
+        """
+        self.host = host
+        self.size = size
+        self.port = port
+        self.check_interval = check_interval
+        self.credentials = credentials
+        # (Auth, time it was last used) of the sessions not handed out
+        self.idle = deque()
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def login(self):
+        """ Returns a new Auth that is logged in. """
+        with self.lock:
+            if self.credentials.get('passwd_file', None) and not self.credentials.get('passwd'):
+                # decrypted once, every new session logs in with it
+                self.credentials['passwd'] = Auth.decrypt_gpg_file(
+                    self.credentials['passwd_file']
+                )
+
+        auth = Auth(self.host, self.port)
+        auth.login(**self.credentials)
+        return auth
+
+    @classmethod
+    def is_active(cls, auth):
+        """
+        Returns True if vCenter still considers the session of auth logged in.
+
+        Args:
+            auth (obj): Auth object
+        """
+        try:
+            session_mgr = auth.session.content.sessionManager
+            current = session_mgr.currentSession
+            if not current:
+                return False
+            return session_mgr.SessionIsActive(current.key, current.userName)
+        except vim.fault.NoPermission:
+            # SessionIsActive needs Sessions.ValidateSession, currentSession is enough
+            return True
+        except (vim.fault.NotAuthenticated, IOError):
+            return False
+
+    @classmethod
+    def discard(cls, auth):
+        """
+        Forgets a session that is no longer usable.
+
+        Args:
+            auth (obj): Auth object
+        """
+        ViewManager.release(auth.session)
+        try:
+            Disconnect(auth.session)
+        except (vim.fault.NotAuthenticated, IOError):
+            pass
+
+    def acquire(self):
+        """
+        Returns an Auth with an active session, waiting for one to be released
+        if size sessions are in use.
+        """
+        self.slots.acquire()
+        auth = None
+        try:
+            while auth is None:
+                with self.lock:
+                    if not self.idle:
+                        break
+                    auth, last_used = self.idle.pop()
+
+                if time.time() - last_used >= self.check_interval and not self.is_active(auth):
+                    self.logger.info('%s session expired', self.host)
+                    self.discard(auth)
+                    auth = None
+
+            if auth is None:
+                auth = self.login()
+        finally:
+            # a failed login gives its slot back
+            if auth is None:
+                self.slots.release()
+
+        return auth
+
+    def release(self, auth, active=True):
+        """
+        Returns auth to the pool.
+
+        Args:
+            auth (obj):    Auth object from acquire
+            active (bool): False discards the session instead
+        """
+        try:
+            if active:
+                with self.lock:
+                    self.idle.append((auth, time.time()))
+            else:
+                self.discard(auth)
+        finally:
+            self.slots.release()
+
+    @contextmanager
+    def session(self):
+        """
+        Context manager hands out a ServiceInstance, and returns it to the pool
+        afterwards.  A session that raised NotAuthenticated is discarded.
+        """
+        auth = self.acquire()
+        active = True
+        try:
+            yield auth.session
+        except vim.fault.NotAuthenticated:
+            active = False
+            raise
+        finally:
+            self.release(auth, active)
+
+    def close(self):
+        """ Logs out of every idle session. """
+        with self.lock:
+            idle = list(self.idle)
+            self.idle.clear()
+
+        for auth, dummy in idle:
+            auth.logout()
@@ -0,0 +1,408 @@
+#!/usr/bin/python
+# vim: ts=4 sw=4 et
+"""Persistent inventory cache for vctools queries."""
+import json
+import os
+import sqlite3
+import time
+from vctools import Logger
+
+class InventoryCache(Logger):
+    """
+    Class stores query results in a local SQLite database keyed by vCenter
+    host, object type and scope (i.e. the cluster or datacenter name), so
+    read-mostly queries can be answered without asking vCenter.  The same
+    database holds the inventory kept up to date by vctools sync, which
+    queries read instead while the last sync is not older than the inventory
+    ttl.  Every object type has its own time to live in seconds, which can be
+    overridden in the dotrc file:
+
+        cache:
+          path: ~/.cache/vctools/inventory.db
+          ttl:
+            clusters: 3600
+            vms: 300
+    """
+    default_path = '~/.cache/vctools/inventory.db'
+    default_ttl = {
+        'clusters': 3600,
+        'datastores': 300,
+        'folders': 3600,
+        'networks': 3600,
+        'vms': 300,
+        'vmconfig': 300,
+        'inventory': 300,
+    }
+
+    def __init__(self, host, enabled=True, refresh=False, path=None, ttl=None):
+        """
+        Args:
+            host (str):     vCenter host
+            enabled (bool): If False, results are neither read nor stored.
+                Invalidation still applies so other runs don't see stale data.
+            refresh (bool): Ignore cached results, but store the new ones.
+            path (str):     Path of the SQLite database
+            ttl (dict):     Object type as key, time to live in seconds as value
+        """
+        self.host = host
+        self.enabled = enabled
+        self.refresh = refresh
+        self.path = os.path.expanduser(path or self.default_path)
+        self.ttl = dict(self.default_ttl)
+        if ttl:
+            self.ttl.update(ttl)
+
+    @classmethod
+    def options(cls, config):
+        """
+        Returns the keyword arguments of InventoryCache from the cache section
+        of the dotrc file, or raises ValueError if it has unknown keys.
+
+        Args:
+            config (dict): Cache section of the dotrc file, or None
+        """
+        config = config or {}
+        unknown = sorted(key for key in config if key not in ('path', 'ttl'))
+        if unknown:
+            raise ValueError(
+                'Unknown keys in the cache section of the dotrc file: %s' % (', '.join(unknown))
+            )
+
+        return dict((key, config[key]) for key in ('path', 'ttl') if key in config)
+
+    def _connect(self, create=False):
+        """
+        Returns a new connection to the database, or None if it does not exist
+        and create is False.  Connections are not shared, so the cache can be
+        used from several threads.
+        """
+        if not os.path.exists(self.path):
+            if not create:
+                return None
+            cache_dir = os.path.dirname(self.path)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir, 0o700)
+
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS query_cache ('
+            'host TEXT, obj_type TEXT, scope TEXT, updated REAL, rows TEXT, '
+            'PRIMARY KEY (host, obj_type, scope))'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS inventory ('
+            'host TEXT, moid TEXT, obj_type TEXT, props TEXT, '
+            'PRIMARY KEY (host, moid))'
+        )
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS inventory_version ('
+            'host TEXT PRIMARY KEY, collector TEXT, version TEXT, updated REAL)'
+        )
+        return conn
+
+    def get(self, obj_type, scope=''):
+        """
+        Returns the cached rows if they have not expired, otherwise None.
+
+        Args:
+            obj_type (str): Object type, i.e. clusters
+            scope (str):    Name of the cluster or datacenter queried
+        """
+        if not self.enabled or self.refresh:
+            return None
+
+        conn = self._connect()
+        if not conn:
+            return None
+
+        try:
+            row = conn.execute(
+                'SELECT updated, rows FROM query_cache '
+                'WHERE host = ? AND obj_type = ? AND scope = ?',
+                (self.host, obj_type, scope)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if not row:
+            return None
+
+        updated, rows = row
+        if time.time() - updated > self.ttl.get(obj_type, 0):
+            self.logger.debug('%s %s %s expired', self.host, obj_type, scope)
+            return None
+
+        self.logger.debug('%s %s %s cached', self.host, obj_type, scope)
+        return json.loads(rows)
+
+    def set(self, obj_type, scope, rows):
+        """
+        Stores rows for obj_type and scope.
+
+        Args:
+            obj_type (str): Object type, i.e. clusters
+            scope (str):    Name of the cluster or datacenter queried
+            rows (obj):     Any JSON serializable result
+        """
+        if not self.enabled:
+            return
+
+        conn = self._connect(create=True)
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?, ?)',
+                    (self.host, obj_type, scope, time.time(), json.dumps(rows))
+                )
+        finally:
+            conn.close()
+
+    def fetch(self, obj_type, scope, func):
+        """
+        Returns the cached rows for obj_type and scope, or calls func and
+        stores its result.
+
+        Args:
+            obj_type (str): Object type, i.e. clusters
+            scope (str):    Name of the cluster or datacenter queried
+            func (obj):     Callable that returns the rows from vCenter
+        """
+        rows = self.get(obj_type, scope)
+        if rows is None:
+            rows = func()
+            if rows is not None:
+                self.set(obj_type, scope, rows)
+
+        return rows
+
+    def stream(self, obj_type, scope, rows):
+        """
+        Generator yields rows as they are produced, and stores them once all
+        of them have been yielded.  Rows are only kept in memory while the
+        cache is enabled.
+
+        Args:
+            obj_type (str): Object type, i.e. vms
+            scope (str):    Name of the cluster or datacenter queried
+            rows (iter):    Rows from vCenter, i.e. from a generator
+        """
+        stored = [] if self.enabled else None
+
+        for row in rows:
+            if stored is not None:
+                stored.append(row)
+            yield row
+
+        if stored is not None:
+            self.set(obj_type, scope, stored)
+
+    def invalidate(self, *obj_types):
+        """
+        Drops cached rows for this host after vctools changes the inventory.
+        The synced inventory is marked stale as well, so queries don't read
+        it again until the next sync has applied the change.
+
+        Args:
+            obj_types (str): Object types to drop, all types if empty.
+        """
+        conn = self._connect()
+        if not conn:
+            return
+
+        try:
+            with conn:
+                if obj_types:
+                    conn.executemany(
+                        'DELETE FROM query_cache WHERE host = ? AND obj_type = ?',
+                        [(self.host, obj_type) for obj_type in obj_types]
+                    )
+                else:
+                    conn.execute('DELETE FROM query_cache WHERE host = ?', (self.host,))
+                conn.execute(
+                    'UPDATE inventory_version SET updated = NULL WHERE host = ?', (self.host,)
+                )
+        finally:
+            conn.close()
+
+        self.logger.debug('%s %s', self.host, ' '.join(obj_types) or 'all')
+
+    def sync_state(self):
+        """
+        Returns the PropertyCollector and version token of the last sync.
+
+        Returns:
+            (collector, version) (tuple): moId of the collector and its version,
+                or (None, '') if this host was never synced.
+        """
+        conn = self._connect()
+        if not conn:
+            return (None, '')
+
+        try:
+            row = conn.execute(
+                'SELECT collector, version FROM inventory_version WHERE host = ?',
+                (self.host,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if not row:
+            return (None, '')
+
+        return (row[0], row[1])
+
+    def sync_age(self):
+        """
+        Returns the seconds since the inventory of this host was last synced,
+        or None if it never was or vctools changed it since.
+        """
+        conn = self._connect()
+        if not conn:
+            return None
+
+        try:
+            row = conn.execute(
+                'SELECT updated FROM inventory_version WHERE host = ?', (self.host,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        if not row or row[0] is None:
+            return None
+
+        return time.time() - row[0]
+
+    def touch_sync(self):
+        """ Marks the inventory of this host as synced now, when nothing changed. """
+        conn = self._connect()
+        if not conn:
+            return
+
+        try:
+            with conn:
+                conn.execute(
+                    'UPDATE inventory_version SET updated = ? WHERE host = ?',
+                    (time.time(), self.host)
+                )
+        finally:
+            conn.close()
+
+    def apply_updates(self, collector, version, updates):
+        """
+        Applies inventory changes and stores the version token they lead to in
+        one transaction, so an interrupted sync never skips a delta.
+
+        Args:
+            collector (str): moId of the PropertyCollector
+            version (str):   Version token returned with the updates
+            updates (list):  A list of (kind, moid, obj_type, assigned, removed)
+                tuples. kind is enter, modify or leave, assigned is a dict of
+                changed properties and removed a list of removed properties.
+        """
+        conn = self._connect(create=True)
+        try:
+            with conn:
+                for kind, moid, obj_type, assigned, removed in updates:
+                    if kind == 'leave':
+                        conn.execute(
+                            'DELETE FROM inventory WHERE host = ? AND moid = ?',
+                            (self.host, moid)
+                        )
+                        continue
+
+                    props = {}
+                    if kind == 'modify':
+                        row = conn.execute(
+                            'SELECT props FROM inventory WHERE host = ? AND moid = ?',
+                            (self.host, moid)
+                        ).fetchone()
+                        if row:
+                            props = json.loads(row[0])
+
+                    props.update(assigned)
+                    for name in removed:
+                        props.pop(name, None)
+
+                    conn.execute(
+                        'INSERT OR REPLACE INTO inventory VALUES (?, ?, ?, ?)',
+                        (self.host, moid, obj_type, json.dumps(props))
+                    )
+
+                conn.execute(
+                    'INSERT OR REPLACE INTO inventory_version VALUES (?, ?, ?, ?)',
+                    (self.host, collector, version, time.time())
+                )
+        finally:
+            conn.close()
+
+    def prune(self, moids):
+        """
+        Drops the stored objects of this host that are not in moids, once a
+        full sync has stored every object that still exists.  The inventory
+        is never emptied in between, so queries can keep reading it.
+
+        Args:
+            moids (set): moIds of every object of the full sync
+        """
+        conn = self._connect()
+        if not conn:
+            return
+
+        try:
+            with conn:
+                stale = [
+                    (self.host, moid) for (moid,) in conn.execute(
+                        'SELECT moid FROM inventory WHERE host = ?', (self.host,)
+                    ).fetchall()
+                    if moid not in moids
+                ]
+                conn.executemany('DELETE FROM inventory WHERE host = ? AND moid = ?', stale)
+        finally:
+            conn.close()
+
+        self.logger.debug('%s %s stale objects', self.host, len(stale))
+
+    def inventory_types(self):
+        """ Returns the managed object types of the synced inventory of this host. """
+        conn = self._connect()
+        if not conn:
+            return []
+
+        try:
+            rows = conn.execute(
+                'SELECT DISTINCT obj_type FROM inventory WHERE host = ?', (self.host,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        return [row[0] for row in rows]
+
+    def inventory(self, obj_type=None):
+        """
+        Returns the synced inventory of this host.
+
+        Args:
+            obj_type (str): Managed object type, i.e. VirtualMachine, or None
+                for every type.
+
+        Returns:
+            inventory (dict): moId as key, dict of properties as value.
+        """
+        conn = self._connect()
+        if not conn:
+            return {}
+
+        try:
+            if obj_type:
+                rows = conn.execute(
+                    'SELECT moid, props FROM inventory WHERE host = ? AND obj_type = ?',
+                    (self.host, obj_type)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    'SELECT moid, props FROM inventory WHERE host = ?', (self.host,)
+                ).fetchall()
+        finally:
+            conn.close()
+
+        return dict((moid, json.loads(props)) for moid, props in rows)
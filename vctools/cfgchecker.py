@@ -4,6 +4,7 @@ from __future__ import print_function
 from pyVmomi import vim # pylint: disable=E0611
 from vctools.prompts import Prompts
 from vctools.query import Query
+from vctools.views import ViewManager
 
 class CfgCheck(object):
     """ Cfg checker class."""
@@ -19,10 +20,7 @@ class CfgCheck(object):
         Args:
             cfg    (obj): Yaml object
         """
-        clusters = Query.create_container(
-            auth.session, auth.session.content.rootFolder,
-            [vim.ComputeResource], True
-        )
+        clusters = ViewManager.for_session(auth.session).view(vim.ComputeResource)
         # name
         if 'vmconfig' in cfg:
 
@@ -40,10 +38,10 @@ class CfgCheck(object):
             # cluster
             if 'cluster' in cfg['vmconfig']:
                 cluster = cfg['vmconfig']['cluster']
-                cluster_obj = Query.get_obj(clusters.view, cluster)
+                cluster_obj = Query.get_obj(clusters, cluster)
             else:
                 cluster = Prompts.clusters(auth.session)
-                cluster_obj = Query.get_obj(clusters.view, cluster)
+                cluster_obj = Query.get_obj(clusters, cluster)
                 print('\n%s selected.' % (cluster))
             # datastore
             if 'datastore' in cfg['vmconfig']:
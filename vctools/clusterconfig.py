@@ -7,6 +7,7 @@ from pyVmomi import vim # pylint: disable=E0611
 from vctools.query import Query
 from vctools import Logger
 from vctools.tasks import Tasks
+from vctools.views import ViewManager
 
 class ClusterConfig(Logger):
     """Various config options for Virtual Machines."""
@@ -43,49 +44,50 @@ class ClusterConfig(Logger):
         self.logger.debug(cluster, drs_type, name, vms, function)
 
         # containers we need
-        clusters = Query.create_container(
-            self.auth.session, self.auth.session.content.rootFolder,
-            [vim.ComputeResource], True
-        )
-        virtual_machines = Query.create_container(
-            self.auth.session, self.auth.session.content.rootFolder,
-            [vim.VirtualMachine], True
-        )
+        views = ViewManager.for_session(self.auth.session)
+        clusters = views.view(vim.ComputeResource)
+        virtual_machines = views.view(vim.VirtualMachine)
 
         # our cluster object
-        cluster_obj = Query.get_obj(clusters.view, cluster)
+        cluster_obj = Query.get_obj(clusters, cluster)
 
         if drs_type == 'anti-affinity':
 
+            # every rule of the cluster, fetched once for all checks
+            rules = Query.cluster_rules(cluster_obj)
+
             if function == 'add':
 
                 vm_obj_list = []
                 for vm_obj in vms:
-                    vm_obj_list.append(Query.get_obj(virtual_machines.view, vm_obj))
+                    vm_obj_list.append(Query.get_obj(virtual_machines, vm_obj))
 
                 # check to see if this rule name is in use
-                if Query.is_anti_affinity_rule(cluster_obj, name):
+                if Query.is_anti_affinity_rule(cluster_obj, name, rules):
                     raise ValueError('Error: rule name "%s" is already in use' % name)
 
                 # check to see vms are in the right cluster
-                for vm_obj in vm_obj_list:
-                    if not Query.is_vm_in_cluster(cluster_obj, vm_obj):
-                        raise ValueError(
-                            'Error: the vm "%s" is not in the stated cluster' % vm_obj.name
-                        )
+                vm_ids = Query.cluster_vm_ids(cluster_obj)
+                outside = [
+                    vm_name for vm_name, vm_obj in zip(vms, vm_obj_list)
+                    if not Query.is_vm_in_cluster(cluster_obj, vm_obj, vm_ids)
+                ]
+                if outside:
+                    raise ValueError(
+                        'Error: the vms "%s" are not in the stated cluster' % '", "'.join(outside)
+                    )
 
                 # check to see if the vms already have DRS rules
-                for vm_obj in vm_obj_list:
-                    match = 0
-                    for rule in cluster_obj.configuration.rule:
-                        if hasattr(rule, 'vm'):
-                            for rulevm in rule.vm:
-                                if vm_obj == rulevm:
-                                    match = 1
-                    if match != 0:
-                        raise ValueError(
-                            'Error: the vm "%s" is already in a DRS rule' % vm_obj.name
-                        )
+                vm_rules = Query.vm_rule_index(rules)
+                conflicts = [
+                    '%s (%s)' % (vm_name, ', '.join(vm_rules[vm_obj._moId]))
+                    for vm_name, vm_obj in zip(vms, vm_obj_list)
+                    if vm_obj._moId in vm_rules
+                ]
+                if conflicts:
+                    raise ValueError(
+                        'Error: the vms are already in DRS rules: %s' % '; '.join(conflicts)
+                    )
 
                 new_rule = vim.ClusterAntiAffinityRuleSpec()
                 new_rule.name = name
@@ -107,7 +109,7 @@ class ClusterConfig(Logger):
             #Delete an AntiAffinity Rule
                 # check to see if this rule name is in use, and delete if found
                 found = False
-                for existing_rule in cluster_obj.configuration.rule:
+                for existing_rule in rules:
                     if existing_rule.name == name:
                         found = True
                         # doublecheck this is an AA rule
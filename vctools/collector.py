@@ -0,0 +1,177 @@
+#!/usr/bin/python
+# vim: ts=4 sw=4 et
+"""PropertyCollector helpers for vctools."""
+from pyVmomi import vim, vmodl # pylint: disable=no-name-in-module
+from vctools import Logger
+
+class Collector(Logger):
+    """
+    Class wraps the vSphere PropertyCollector.  Reading an attribute on a
+    managed object is a SOAP round trip, so these methods retrieve properties
+    for many objects at once instead.
+    """
+    def __init__(self):
+        pass
+
+    @classmethod
+    def property_collector(cls, container):
+        """
+        Returns the PropertyCollector of the session that owns container.
+
+        Args:
+            container (obj): ContainerView or list of managed objects
+        """
+        if isinstance(container, vim.view.ContainerView):
+            stub = container._stub
+        else:
+            stub = container[0]._stub
+
+        return vmodl.query.PropertyCollector('propertyCollector', stub)
+
+    @classmethod
+    def traversal(cls, obj_type, path, *select_set):
+        """
+        Returns a TraversalSpec that follows path from obj_type objects, and
+        then continues with select_set from the objects it reaches.
+
+        Args:
+            obj_type (obj): Managed object type that has the path property
+            path (str):     Property that references other managed objects
+            select_set (obj): TraversalSpecs to apply to the referenced objects
+        """
+        return vmodl.query.PropertyCollector.TraversalSpec(
+            name='traverse%s%s' % (obj_type.__name__.split('.')[-1], path),
+            type=obj_type, path=path, skip=False, selectSet=list(select_set)
+        )
+
+    @classmethod
+    def recursive_traversal(cls, obj_type, path):
+        """
+        Returns a TraversalSpec that follows path from obj_type objects, and
+        follows it again from every obj_type object it reaches, i.e. to walk a
+        folder tree of any depth.
+
+        Args:
+            obj_type (obj): Managed object type that has the path property
+            path (str):     Property that references other managed objects
+        """
+        traversal = cls.traversal(obj_type, path)
+        traversal.selectSet = [
+            vmodl.query.PropertyCollector.SelectionSpec(name=traversal.name)
+        ]
+        return traversal
+
+    @classmethod
+    def object_specs(cls, container, select_set=None):
+        """
+        Returns the ObjectSpecs that select every object inside container. A
+        ContainerView is traversed by vCenter, while a list of managed objects
+        is selected one spec per object without any round trips.
+
+        Args:
+            container (obj):  ContainerView or list of managed objects
+            select_set (list): TraversalSpecs to apply to each selected object
+        """
+        select_set = list(select_set or [])
+
+        if isinstance(container, vim.view.ContainerView):
+            traversal = vmodl.query.PropertyCollector.TraversalSpec(
+                name='traverseView', path='view', skip=False,
+                type=vim.view.ContainerView, selectSet=select_set
+            )
+            return [
+                vmodl.query.PropertyCollector.ObjectSpec(
+                    obj=container, skip=True, selectSet=[traversal]
+                )
+            ]
+
+        return [
+            vmodl.query.PropertyCollector.ObjectSpec(obj=obj, skip=False, selectSet=select_set)
+            for obj in container
+        ]
+
+    @classmethod
+    def retrieve(cls, container, path_set, obj_type=vim.ManagedEntity, max_objects=None):
+        """
+        Generator retrieves path_set for every object inside container with
+        RetrievePropertiesEx, and yields each object with its properties.
+
+        Args:
+            container (obj):   ContainerView or list of managed objects
+            path_set (list):   Property paths to retrieve, i.e. ['name']
+            obj_type (obj):    Managed object type the properties belong to
+            max_objects (int): Page size, vCenter picks one if None
+
+        Yields:
+            (obj, props) (tuple): Managed object and a dict of its properties
+        """
+        for obj, props in cls.collect(container, {obj_type: path_set}, max_objects=max_objects):
+            yield obj, props
+
+    @classmethod
+    def collect(cls, container, properties, select_set=None, max_objects=None):
+        """
+        Generator retrieves properties of several managed object types in one
+        RetrievePropertiesEx call.  select_set follows references from the
+        objects inside container, i.e. from clusters to their datastores.
+
+        Args:
+            container (obj):   ContainerView or list of managed objects
+            properties (dict): Managed object type as key, property paths as value
+            select_set (list): TraversalSpecs to apply to each selected object
+            max_objects (int): Page size, vCenter picks one if None
+
+        Yields:
+            (obj, props) (tuple): Managed object and a dict of its properties
+        """
+        if not isinstance(container, vim.view.ContainerView) and not container:
+            return
+
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=cls.object_specs(container, select_set),
+            propSet=[
+                vmodl.query.PropertyCollector.PropertySpec(
+                    type=obj_type, pathSet=list(path_set), all=False
+                )
+                for obj_type, path_set in properties.iteritems()
+            ]
+        )
+
+        for obj, props in cls.retrieve_spec(
+                cls.property_collector(container), filter_spec, max_objects
+        ):
+            yield obj, props
+
+    @classmethod
+    def retrieve_spec(cls, collector, filter_spec, max_objects=None):
+        """
+        Generator runs a FilterSpec through RetrievePropertiesEx and follows
+        ContinueRetrievePropertiesEx for every remaining page.  If the caller
+        stops early, the outstanding result set is cancelled.
+
+        Args:
+            collector (obj):   PropertyCollector object
+            filter_spec (obj): PropertyCollector.FilterSpec object
+            max_objects (int): Page size, vCenter picks one if None
+
+        Yields:
+            (obj, props) (tuple): Managed object and a dict of its properties
+        """
+        options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=max_objects)
+        result = collector.RetrievePropertiesEx(specSet=[filter_spec], options=options)
+
+        token = None
+        try:
+            while result:
+                token = result.token
+                for content in result.objects:
+                    yield content.obj, dict(
+                        (prop.name, prop.val) for prop in content.propSet
+                    )
+                if not token:
+                    break
+                result = collector.ContinueRetrievePropertiesEx(token=token)
+                token = None
+        finally:
+            if token:
+                collector.CancelRetrievePropertiesEx(token=token)
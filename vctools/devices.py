@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# vim: ts=4 sw=4 et
+"""Virtual device index for vctools."""
+from pyVmomi import vim # pylint: disable=no-name-in-module
+from vctools.collector import Collector
+from vctools import Logger
+
+class DeviceIndex(Logger):
+    """
+    Class indexes the virtual devices of a VM, so devices can be looked up
+    by key, label, class or controller without fetching
+    config.hardware.device again for every lookup.
+    """
+    def __init__(self, devices):
+        """
+        Args:
+            devices (list): VirtualDevice objects of a VM
+        """
+        self.devices = list(devices or [])
+        self.keys = {}
+        self.labels = {}
+        self.controllers = {}
+
+        for device in self.devices:
+            self.keys[device.key] = device
+            self.labels[device.deviceInfo.label] = device
+            if device.controllerKey is not None:
+                self.controllers.setdefault(device.controllerKey, []).append(device)
+
+    @classmethod
+    def for_vms(cls, objs):
+        """
+        Returns the indexes of several VMs, retrieved in one call.
+
+        Args:
+            objs (list): VirtualMachine objects
+
+        Returns:
+            indexes (dict): moId of VM as key, DeviceIndex as value.
+        """
+        indexes = dict((obj._moId, cls([])) for obj in objs)
+
+        for obj, props in Collector.retrieve(
+                objs, ['config.hardware.device'], vim.VirtualMachine
+        ):
+            indexes[obj._moId] = cls(props.get('config.hardware.device', []))
+
+        return indexes
+
+    @classmethod
+    def for_vm(cls, obj):
+        """
+        Returns the index of a VM.
+
+        Args:
+            obj (obj): VirtualMachine object
+        """
+        return cls.for_vms([obj])[obj._moId]
+
+    def by_key(self, key):
+        """ Returns the device with key, or None. """
+        return self.keys.get(key, None)
+
+    def by_label(self, label):
+        """
+        Returns the device with label, i.e. Hard disk 1.
+
+        Args:
+            label (str): Label of device
+        """
+        if label not in self.labels:
+            raise ValueError('%s not found.' % (label))
+
+        return self.labels[label]
+
+    def by_prefix(self, prefix):
+        """
+        Returns the devices whose label starts with prefix, i.e. Hard disk.
+
+        Args:
+            prefix (str): Beginning of the label of devices
+        """
+        return [
+            device for device in self.devices if device.deviceInfo.label.startswith(prefix)
+        ]
+
+    def by_class(self, device_class):
+        """
+        Returns the devices of a class.
+
+        Args:
+            device_class (obj): Device class, i.e. vim.vm.device.VirtualDisk
+        """
+        return [device for device in self.devices if isinstance(device, device_class)]
+
+    def by_controller(self, key):
+        """
+        Returns the devices attached to a controller.
+
+        Args:
+            key (int): Key of the controller
+        """
+        return list(self.controllers.get(key, []))
+
+    def label(self, key):
+        """ Returns the label of the device with key. """
+        return self.keys[key].deviceInfo.label
+
+    def key(self, query):
+        """
+        Returns the key and controllerKey of the last device whose label
+        contains query, i.e. CD/DVD.
+
+        Args:
+            query (str): Part of the label of a device
+
+        Returns:
+            keys (tuple): The key and controllerKey of the device
+        """
+        matches = [device for device in self.devices if query in device.deviceInfo.label]
+
+        if not matches:
+            raise ValueError('%s not found.' % (query))
+
+        return (matches[-1].key, matches[-1].controllerKey)
@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# vim: ts=4 sw=4 et
+"""Multi-process executor for bulk operations."""
+import multiprocessing
+import Queue
+from vctools.auth import Auth
+from vctools import Logger
+
+class CloneExecutor(Logger):
+    """
+    Class runs a bulk operation in several processes, each with a session of
+    its own.  Every worker logs in with a clone ticket of the parent session,
+    so the user is not prompted and the password file is not decrypted again,
+    and no pyVmomi stub is shared between processes.
+    """
+    # seconds between checks for workers that exited without reporting
+    poll = 1
+    def __init__(self, auth, workers):
+        """
+        Args:
+            auth (obj):    Auth object that is logged in
+            workers (int): Number of processes
+        """
+        self.auth = auth
+        self.workers = workers
+
+    @classmethod
+    def chunks(cls, items, count):
+        """
+        Returns items split into count lists of about the same size.
+
+        Args:
+            items (list): Items to split, i.e. names of VMs
+            count (int):  Number of lists
+        """
+        return [chunk for chunk in (items[num::count] for num in range(count)) if chunk]
+
+    @classmethod
+    def worker(cls, num, host, port, clone, func, chunk, results):
+        """
+        Runs func in a worker process with a cloned session, and puts its
+        number, the chunk and its error, or None, on results.
+
+        Args:
+            num (int):     Number of the worker
+            host (str):    vCenter host
+            port (int):    Port to connect to host
+            clone (tuple): Clone ticket, stub version and verify_ssl of the parent
+            func (obj):    Callable that takes an Auth object and chunk
+            chunk (list):  Items for this worker
+            results (obj): multiprocessing.Queue
+        """
+        auth = Auth(host, port)
+        error = None
+        try:
+            auth.clone_login(*clone)
+            func(auth, chunk)
+        except Exception as err: # pylint: disable=broad-except
+            # the parent only needs the message, faults may not pickle
+            error = getattr(err, 'msg', None) or str(err)
+
+        if auth.session:
+            try:
+                auth.logout()
+            except Exception: # pylint: disable=broad-except
+                pass
+
+        results.put((num, chunk, error))
+
+    def run(self, func, items):
+        """
+        Generator splits items across the workers and runs func with each
+        chunk.  Clone tickets are acquired in the parent, one per worker.  A
+        worker that exits without reporting, i.e. killed by the OOM killer,
+        fails its chunk instead of blocking the run.
+
+        Args:
+            func (obj):   Callable that takes an Auth object and a list of items
+            items (list): Items to split, i.e. names of VMs
+
+        Yields:
+            (chunk, error) (tuple): Items of a worker, and the message of the
+                error that stopped it or None
+        """
+        results = multiprocessing.Queue()
+        stub = self.auth.session._stub
+        procs = []
+        # chunk of each worker that has not reported, by number of the worker
+        pending = {}
+        # workers that exited without reporting
+        exited = set()
+
+        for num, chunk in enumerate(self.chunks(list(items), self.workers)):
+            clone = (self.auth.clone_ticket(), stub.version, self.auth.verify_ssl)
+            proc = multiprocessing.Process(
+                target=self.worker,
+                args=(num, self.auth.host, self.auth.port, clone, func, chunk, results)
+            )
+            proc.start()
+            procs.append(proc)
+            pending[num] = (proc, chunk)
+
+        self.logger.info('%s workers', len(procs))
+
+        try:
+            while pending:
+                try:
+                    num, chunk, error = results.get(timeout=self.poll)
+                except Queue.Empty:
+                    # results are flushed before a worker exits, so one that
+                    # exited a whole poll ago without reporting never will
+                    for num, (proc, chunk) in pending.items():
+                        if num in exited:
+                            del pending[num]
+                            yield chunk, 'worker exited with code %s' % (proc.exitcode)
+                        elif not proc.is_alive():
+                            exited.add(num)
+                    continue
+
+                pending.pop(num, None)
+                yield chunk, error
+        finally:
+            for proc in procs:
+                proc.join()
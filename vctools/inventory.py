@@ -0,0 +1,255 @@
+#!/usr/bin/python
+# vim: ts=4 sw=4 et
+"""In-process inventory indexes for vctools."""
+import threading
+from pyVmomi import vim # pylint: disable=no-name-in-module
+from vctools.collector import Collector
+from vctools import Logger
+
+class NameIndex(Logger):
+    """
+    Class maps the names of every object inside a ContainerView to their
+    managed object references.  The index is built with one PropertyCollector
+    call the first time a view is searched, and then reused for the rest of
+    the run until it is invalidated.
+    """
+    # built indexes, keyed by session and view
+    indexes = {}
+    # indexes are looked up from the threads of query_hosts and the API
+    lock = threading.Lock()
+
+    def __init__(self, container):
+        """
+        Args:
+            container (obj): ContainerView object
+        """
+        self.container = container
+        self.names = {}
+
+        for obj, props in Collector.retrieve(container, ['name']):
+            self.names.setdefault(props.get('name'), []).append(obj)
+
+        self.logger.debug('%s %s names', container, len(self.names))
+
+    @staticmethod
+    def _key(container):
+        """ Returns the registry key for container. """
+        return (id(container._stub), container._moId)
+
+    @classmethod
+    def for_container(cls, container):
+        """
+        Returns the index for container, building it if necessary.
+
+        Args:
+            container (obj): ContainerView object
+        """
+        key = cls._key(container)
+        with cls.lock:
+            index = cls.indexes.get(key, None)
+
+        if index is None:
+            # built without the lock, so other views are not held up by the call
+            index = cls(container)
+            with cls.lock:
+                index = cls.indexes.setdefault(key, index)
+
+        return index
+
+    @classmethod
+    def invalidate(cls, container=None):
+        """
+        Drops built indexes so they are rebuilt on their next lookup.  This
+        should be called after any task that creates, renames or destroys
+        entities.
+
+        Args:
+            container (obj): ContainerView object, or None for all indexes.
+        """
+        with cls.lock:
+            if container is None:
+                cls.indexes.clear()
+            else:
+                cls.indexes.pop(cls._key(container), None)
+
+    @classmethod
+    def invalidate_session(cls, stub):
+        """
+        Drops the indexes built with a session, so long-lived sessions see
+        entities created since.
+
+        Args:
+            stub (obj): SoapStubAdapter of the session
+        """
+        with cls.lock:
+            for key in [key for key in cls.indexes if key[0] == id(stub)]:
+                del cls.indexes[key]
+
+    def lookup(self, name):
+        """
+        Returns the object that matches name.  If more than one object shares
+        the name, the first one is returned and a warning is logged.
+
+        Args:
+            name (str): Name of object
+        """
+        objs = self.names.get(name, None)
+
+        if not objs:
+            raise ValueError('%s not found.' % (name))
+
+        if len(objs) > 1:
+            self.logger.warning(
+                '%s matches %s objects: %s', name, len(objs),
+                ' '.join(obj._moId for obj in objs)
+            )
+
+        return objs[0]
+
+    def duplicates(self):
+        """
+        Returns the names that are shared by more than one object.
+
+        Returns:
+            duplicates (dict): name as key, list of objects as value.
+        """
+        return dict(
+            (name, objs) for name, objs in self.names.iteritems() if len(objs) > 1
+        )
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+
+class FolderIndex(Logger):
+    """
+    Class maps the slash separated paths of every VM folder in a datacenter,
+    i.e. Linux Team/web, to their managed object references.  The whole
+    folder tree under vmFolder is retrieved in one PropertyCollector call,
+    regardless of its depth.
+    """
+    # built indexes, keyed by session and datacenter
+    indexes = {}
+    lock = threading.Lock()
+
+    def __init__(self, datacenter):
+        """
+        Args:
+            datacenter (obj): Datacenter object
+        """
+        self.datacenter = datacenter
+        self.paths = {}
+        self.names = {}
+
+        folders = {}
+        for obj, props in Collector.collect(
+                [datacenter], {vim.Folder: ['name', 'parent']},
+                select_set=[
+                    Collector.traversal(
+                        vim.Datacenter, 'vmFolder',
+                        Collector.recursive_traversal(vim.Folder, 'childEntity')
+                    )
+                ]
+        ):
+            folders[obj._moId] = (obj, props['name'], props['parent']._moId)
+
+        def path(moid):
+            """ Returns the path of a folder, vmFolder itself is the root. """
+            dummy, name, parent = folders[moid]
+            if parent not in folders:
+                return ''
+            parent_path = path(parent)
+            return parent_path + '/' + name if parent_path else name
+
+        for moid, (obj, name, dummy) in folders.iteritems():
+            folder_path = path(moid)
+            if folder_path:
+                self.paths[folder_path] = obj
+                self.names.setdefault(name, []).append(folder_path)
+
+        self.logger.debug('%s %s folders', datacenter._moId, len(self.paths))
+
+    @staticmethod
+    def _key(datacenter):
+        """ Returns the registry key for datacenter. """
+        return (id(datacenter._stub), datacenter._moId)
+
+    @classmethod
+    def for_datacenter(cls, datacenter):
+        """
+        Returns the index for datacenter, building it if necessary.
+
+        Args:
+            datacenter (obj): Datacenter object
+        """
+        key = cls._key(datacenter)
+        with cls.lock:
+            index = cls.indexes.get(key, None)
+
+        if index is None:
+            index = cls(datacenter)
+            with cls.lock:
+                index = cls.indexes.setdefault(key, index)
+
+        return index
+
+    @classmethod
+    def invalidate(cls, datacenter=None):
+        """
+        Drops built indexes so they are rebuilt on their next lookup.
+
+        Args:
+            datacenter (obj): Datacenter object, or None for all indexes.
+        """
+        with cls.lock:
+            if datacenter is None:
+                cls.indexes.clear()
+            else:
+                cls.indexes.pop(cls._key(datacenter), None)
+
+    @classmethod
+    def invalidate_session(cls, stub):
+        """
+        Drops the indexes built with a session, so long-lived sessions see
+        folders created since.
+
+        Args:
+            stub (obj): SoapStubAdapter of the session
+        """
+        with cls.lock:
+            for key in [key for key in cls.indexes if key[0] == id(stub)]:
+                del cls.indexes[key]
+
+    def lookup(self, path):
+        """
+        Returns the folder at path.  A folder name without a path is accepted
+        as long as no other folder in the datacenter has the same name.
+
+        Args:
+            path (str): Path of folder, i.e. Linux Team/web
+        """
+        path = path.strip('/')
+
+        if path in self.paths:
+            return self.paths[path]
+
+        paths = self.names.get(path, [])
+
+        if len(paths) > 1:
+            raise ValueError(
+                '%s matches %s folders: %s' % (path, len(paths), ', '.join(sorted(paths)))
+            )
+
+        if not paths:
+            raise ValueError('%s not found.' % (path))
+
+        return self.paths[paths[0]]
+
+    def __contains__(self, path):
+        return path.strip('/') in self.paths
+
+    def __len__(self):
+        return len(self.paths)
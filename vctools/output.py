@@ -0,0 +1,251 @@
+#!/usr/bin/python
+# vim: ts=4 sw=4 et
+"""Output formats for vctools queries."""
+from __future__ import print_function
+import csv
+import json
+import sys
+import threading
+from StringIO import StringIO
+from vctools import Logger
+
+# pylint: disable=too-many-instance-attributes
+class Output(Logger):
+    """
+    Class writes query results as text, json, ndjson or csv.  Rows are
+    written as they are consumed from the Query layer, so generators are never
+    materialised in memory.
+
+        text:   space aligned columns, as vctools has always printed them
+        json:   one object for the run, with a list of rows per section
+        ndjson: one object per row, tagged with its section
+        csv:    a header followed by the rows of one section
+
+    When several vCenters are queried at once, each of them writes through
+    its own tagged Output, and every row carries the name of its vCenter.
+    """
+    formats = ['text', 'json', 'ndjson', 'csv']
+
+    def __init__(self, fmt='text', stream=None):
+        """
+        Args:
+            fmt (str):    Output format, one of formats
+            stream (obj): File object to write to, stdout if None
+        """
+        self.fmt = fmt
+        self.stream = stream or sys.stdout
+        self.sections = 0
+        self.vcenter = None
+        self.parent = None
+        # shared by tagged outputs, so rows are never written halfway
+        self.lock = threading.RLock()
+        # csv sections that already have a header
+        self.headers = set()
+
+    def tagged(self, vcenter):
+        """
+        Returns an Output for one of several vCenters that are queried
+        concurrently.  Rows are written to the same stream as they arrive,
+        except for json, where every vCenter is written as one object once it
+        is closed.
+
+        Args:
+            vcenter (str): Name of vCenter
+        """
+        output = Output(self.fmt, self.stream)
+        output.vcenter = vcenter
+        output.parent = self
+        output.lock = self.lock
+        output.headers = self.headers
+
+        if self.fmt == 'json':
+            output.stream = StringIO()
+
+        return output
+
+    @staticmethod
+    def _utf8(val):
+        """ Returns unicode values, i.e. names from pyVmomi, encoded as UTF-8. """
+        if isinstance(val, unicode):
+            return val.encode('utf-8')
+        return val
+
+    @classmethod
+    def _csv_value(cls, val):
+        """ Flattens a value into a csv cell. """
+        if isinstance(val, list):
+            val = ' '.join(str(cls._utf8(item)) for item in val)
+        elif isinstance(val, dict):
+            val = json.dumps(val, sort_keys=True)
+        elif val is None:
+            val = ''
+
+        return cls._utf8(val)
+
+    @classmethod
+    def _text_value(cls, val):
+        """ Flattens a value into a text column. """
+        if isinstance(val, list):
+            return ' '.join(str(cls._utf8(item)) for item in val)
+        if val is None:
+            return ''
+        return cls._utf8(val)
+
+    def _write(self, data):
+        """ Writes data to the stream without interleaving other writers. """
+        with self.lock:
+            self.stream.write(data)
+
+    def text(self, msg):
+        """
+        Writes a message that only makes sense to humans, i.e. a title.  It is
+        skipped by the machine readable formats.
+
+        Args:
+            msg (str): Message to write
+        """
+        if self.fmt == 'text':
+            msg = self._utf8(msg)
+            if self.vcenter:
+                msg = '{0}\t{1}'.format(self.vcenter, msg)
+            self._write('{0}\n'.format(msg))
+
+    def emit(self, section, fields, rows, text_fmt=None, text_header=None):
+        """
+        Writes rows in the selected format as they are produced.
+
+        Args:
+            section (str):      Name of the query, i.e. datastores
+            fields (list):      Column names of each row
+            rows (iter):        Lists of values in the order of fields
+            text_fmt (str):     Format string for text rows, i.e. '{0:30} {1}'.
+                Values are joined by spaces if None.
+            text_header (list): Row written before the text rows, i.e. a header
+                with spaces in its column names.
+
+        Returns:
+            count (int): Number of rows written
+        """
+        fields = list(fields)
+
+        try:
+            if self.fmt == 'text':
+                count = self._emit_text(rows, text_fmt, text_header)
+            else:
+                if self.vcenter:
+                    fields = ['vcenter'] + fields
+                    rows = ([self.vcenter] + list(row) for row in rows)
+
+                if self.fmt == 'csv':
+                    count = self._emit_csv(section, fields, rows)
+                elif self.fmt == 'ndjson':
+                    count = self._emit_ndjson(section, fields, rows)
+                else:
+                    count = self._emit_json(section, fields, rows)
+        finally:
+            # counted even if the rows failed, so close() ends valid json
+            self.sections += 1
+            with self.lock:
+                self.stream.flush()
+
+        self.logger.debug('%s %s %s rows', self.vcenter or '', section, count)
+        return count
+
+    def _emit_text(self, rows, text_fmt, text_header):
+        """ Writes rows as text columns. """
+        def line(row):
+            """ Returns a row as text. """
+            values = [self._text_value(val) for val in row]
+            if text_fmt:
+                text = text_fmt.format(*values)
+            else:
+                text = ' '.join('{0}'.format(val) for val in values)
+            if self.vcenter:
+                text = '{0}\t{1}'.format(self.vcenter, text)
+            return text + '\n'
+
+        if text_header:
+            self._write(line(text_header))
+
+        count = 0
+        for row in rows:
+            self._write(line(row))
+            count += 1
+
+        return count
+
+    def _emit_ndjson(self, section, fields, rows):
+        """ Writes one JSON object per row. """
+        count = 0
+        for row in rows:
+            obj = dict(zip(fields, row))
+            obj['section'] = section
+            self._write(json.dumps(obj, sort_keys=True) + '\n')
+            count += 1
+
+        return count
+
+    def _emit_json(self, section, fields, rows):
+        """
+        Writes a section of the run object, closed by close().  The list of
+        rows is ended even if the rows fail, so the object stays valid.
+        """
+        self.stream.write('{\n' if not self.sections else ',\n')
+        self.stream.write('%s: [' % json.dumps(section))
+
+        count = 0
+        try:
+            for row in rows:
+                self.stream.write(',\n' if count else '\n')
+                self.stream.write(json.dumps(dict(zip(fields, row)), sort_keys=True))
+                count += 1
+        finally:
+            self.stream.write('\n]' if count else ']')
+
+        return count
+
+    def _emit_csv(self, section, fields, rows):
+        """
+        Writes the header once, and the rows.  Sections have different
+        columns, so a stream only takes one of them.
+        """
+        writer = csv.writer(self.stream)
+
+        with self.lock:
+            if self.headers and section not in self.headers:
+                raise ValueError(
+                    'csv output takes one section, %s is already written'
+                    % (', '.join(self.headers))
+                )
+            if section not in self.headers:
+                writer.writerow(fields)
+                self.headers.add(section)
+
+        count = 0
+        for row in rows:
+            values = [self._csv_value(val) for val in row]
+            with self.lock:
+                writer.writerow(values)
+            count += 1
+
+        return count
+
+    def close(self):
+        """
+        Finishes the output, json needs to close its object.  A tagged json
+        output adds its vCenter object to the output it was tagged from.
+        """
+        if self.fmt != 'json':
+            return
+
+        self.stream.write('{}\n' if not self.sections else '\n}\n')
+
+        if self.parent:
+            with self.lock:
+                self.parent.stream.write('{\n' if not self.parent.sections else ',\n')
+                self.parent.stream.write(
+                    '%s: %s' % (json.dumps(self.vcenter), self.stream.getvalue().strip())
+                )
+                self.parent.sections += 1
+        else:
+            self.stream.flush()
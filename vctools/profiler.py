@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# vim: ts=4 sw=4 et
+"""Profiling of vctools commands."""
+from __future__ import print_function
+import cProfile
+import os
+import pstats
+import time
+from vctools import Logger
+
+class Profiler(Logger):
+    """
+    Class runs a command under cProfile, writes the stats to a file for
+    pstats or snakeviz, and summarises where the wall time of the command
+    went:
+
+        soap:    waiting on vCenter, including parsing its responses
+        prompts: waiting on the user to answer a prompt or a password
+        local:   everything else
+
+    Only the main thread is profiled, so the queries of several vCenters,
+    which run in threads, and --workers processes are not broken down.
+    """
+    # (file name suffix, function name) of the calls the wall time is split by
+    soap_funcs = [('SoapAdapter.py', 'InvokeMethod')]
+    prompt_funcs = [
+        ('~', '<raw_input>'), ('getpass.py', 'unix_getpass'),
+        ('getpass.py', 'win_getpass'), ('getpass.py', 'fallback_getpass'),
+    ]
+
+    def __init__(self, path, top=20, sort='cumulative'):
+        """
+        Args:
+            path (str): File the pstats are written to
+            top (int):  Number of functions in the summary
+            sort (str): pstats sort key of the summary
+        """
+        self.path = path
+        self.top = top
+        self.sort = sort
+        self.profile = cProfile.Profile()
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def run(self, func, *args, **kwargs):
+        """
+        Returns the result of func, which is profiled.  The stats are written
+        even if func raises or exits.
+
+        Args:
+            func (obj): Callable to profile, i.e. VCTools.main
+        """
+        start = time.time()
+        times = os.times()
+        try:
+            return self.profile.runcall(func, *args, **kwargs)
+        finally:
+            self.wall = time.time() - start
+            self.cpu = sum(os.times()[:2]) - sum(times[:2])
+            self.profile.dump_stats(self.path)
+            self.logger.info('profile written to %s', self.path)
+
+    @staticmethod
+    def cumulative(stats, funcs):
+        """
+        Returns the cumulative seconds spent in funcs.
+
+        Args:
+            stats (obj):  pstats.Stats object
+            funcs (list): (file name suffix, function name) tuples
+        """
+        seconds = 0.0
+        for (filename, dummy, name), (dummy, dummy, dummy, cumtime, dummy) in (
+                stats.stats.iteritems()
+        ):
+            if any(filename.endswith(suffix) and name == func for suffix, func in funcs):
+                seconds += cumtime
+
+        return seconds
+
+    def report(self, stream):
+        """
+        Writes the split of the wall time and the top functions.
+
+        Args:
+            stream (obj): File object, i.e. sys.stderr
+        """
+        stats = pstats.Stats(self.path, stream=stream)
+        soap = self.cumulative(stats, self.soap_funcs)
+        prompts = self.cumulative(stats, self.prompt_funcs)
+
+        row = '{0:<10} {1:>9.3f}s\n'
+        stream.write(row.format('wall', self.wall))
+        stream.write(row.format('soap', soap))
+        stream.write(row.format('prompts', prompts))
+        stream.write(row.format('local', max(self.wall - soap - prompts, 0.0)))
+        stream.write(row.format('cpu', self.cpu))
+        stream.write('\n')
+
+        stats.sort_stats(self.sort).print_stats(self.top)
@@ -6,6 +6,7 @@ import sys
 import re
 from pyVmomi import vim # pylint: disable=no-name-in-module
 from vctools.query import Query
+from vctools.views import ViewManager
 from vctools import Logger
 
 class Prompts(Logger):
@@ -104,10 +105,8 @@ class Prompts(Logger):
         Returns:
             datastore (str): Name of selected datastore
         """
-        clusters = Query.create_container(
-            session, session.content.rootFolder, [vim.ComputeResource], True
-        )
-        datastores = Query.return_datastores(clusters.view, cluster)
+        clusters = ViewManager.for_session(session).view(vim.ComputeResource)
+        datastores = Query.return_datastores(clusters, cluster)
 
         print('\n')
         if (len(datastores) -1) == 0:
@@ -147,16 +146,12 @@ class Prompts(Logger):
             session (obj):    Auth session object
             datacenter (str): Name of datacenter
         Returns:
-            folder (str): Name of selected folder
+            folder (str): Path of selected folder
         """
-        datacenters = Query.create_container(
-            session, session.content.rootFolder,
-            [vim.Datacenter], True
-        )
+        datacenters = ViewManager.for_session(session).view(vim.Datacenter)
         folders = Query.list_vm_folders(
-            datacenters.view, datacenter
+            datacenters, datacenter
         )
-        folders.sort()
 
         for num, opt in enumerate(folders, start=1):
             print('%s: %s' % (num, opt))
@@ -187,10 +182,7 @@ class Prompts(Logger):
         Returns:
             datacenter (str): Name of selected datacenter
         """
-        datacenters_choices = Query.create_container(
-            session, session.content.rootFolder,
-            [vim.Datacenter], True
-        )
+        datacenters_choices = ViewManager.for_session(session).view(vim.Datacenter)
         datacenters = Query.list_obj_attrs(datacenters_choices, 'name')
         datacenters.sort()
 
@@ -224,10 +216,7 @@ class Prompts(Logger):
         Returns:
             cluster (str): Name of selected cluster
         """
-        clusters_choices = Query.create_container(
-            session, session.content.rootFolder,
-            [vim.ComputeResource], True
-        )
+        clusters_choices = ViewManager.for_session(session).view(vim.ComputeResource)
         clusters = Query.list_obj_attrs(clusters_choices, 'name')
         clusters.sort()
 
@@ -3,9 +3,13 @@
 """Query class for vctools.  All methods that obtain info should go here."""
 from __future__ import division
 from __future__ import print_function
-from pyVmomi import vim # pylint: disable=no-name-in-module
+from pyVmomi import vim, vmodl # pylint: disable=no-name-in-module
+from vctools.collector import Collector
+from vctools.devices import DeviceIndex
+from vctools.inventory import FolderIndex, NameIndex
 from vctools import Logger
 
+# pylint: disable=too-many-public-methods
 class Query(Logger):
     """
     Class handles queries for information regarding for vms, datastores
@@ -51,15 +55,21 @@ class Query(Logger):
     @classmethod
     def get_obj(cls, container, name):
         """
-        Returns an object inside of ContainerView if it matches name.
+        Returns an object inside of ContainerView if it matches name. The
+        names of every object are retrieved with one PropertyCollector call
+        instead of reading obj.name one round trip at a time.  A ContainerView
+        is indexed by name once, so repeated lookups are dictionary lookups.
 
         Args:
-            container (obj):  Container object
+            container (obj):  ContainerView object or list of objects
             name (str):       Name of Container
         """
 
-        for obj in container:
-            if obj.name == name:
+        if isinstance(container, vim.view.ContainerView):
+            return NameIndex.for_container(container).lookup(name)
+
+        for obj, props in Collector.retrieve(container, ['name']):
+            if props.get('name') == name:
                 return obj
 
         raise ValueError('%s not found.' % (name))
@@ -83,54 +93,33 @@ class Query(Logger):
     @classmethod
     def folders_lookup(cls, container, datacenter, name):
         """
-        Returns the object for a folder name.  Currently, it only searches for
-        the folder through one level of subfolders. This method is needed for
-        building new virtual machines.
+        Returns the object for a folder path, i.e. Linux Team/web.  A folder
+        name without a path is enough if it is unique in the datacenter. This
+        method is needed for building new virtual machines.
 
         Args:
             container (obj):  Container object
             datacenter (str): Name of datacenter
-            name (str):       Name of folder
+            name (str):       Path or name of folder
         """
 
         obj = Query.get_obj(container, datacenter)
 
-        if hasattr(obj, 'vmFolder'):
-            for folder in obj.vmFolder.childEntity:
-                if hasattr(folder, 'childType'):
-                    if folder.name == name:
-                        return folder
-                if hasattr(folder, 'childEntity'):
-                    for item in folder.childEntity:
-                        if hasattr(item, 'childType'):
-                            if item.name == name:
-                                return item
-        return None
+        return FolderIndex.for_datacenter(obj).lookup(name)
 
     @classmethod
     def list_vm_folders(cls, container, datacenter):
         """
-        Returns a list of Virtual Machine folders.  Sub folders will be listed
-        with its parent -> subfolder. Currently it only searches for one
-        level of subfolders.
+        Returns a sorted list of the paths of every Virtual Machine folder,
+        with sub folders listed as parent/subfolder.
 
         Args:
             container (obj):  Container object
             datacenter (str): Name of datacenter
         """
         obj = Query.get_obj(container, datacenter)
-        folders = []
-
-        if hasattr(obj, 'vmFolder'):
-            for folder in obj.vmFolder.childEntity:
-                if hasattr(folder, 'childType'):
-                    folders.append(folder.name)
-                if hasattr(folder, 'childEntity'):
-                    for item in folder.childEntity:
-                        if hasattr(item, 'childType'):
-                            folders.append(item.parent.name+' -> '+item.name)
-        return folders
 
+        return sorted(FolderIndex.for_datacenter(obj).paths)
 
     @classmethod
     def datastore_most_space(cls, container, cluster):
@@ -160,6 +149,55 @@ class Query(Logger):
         return None
 
 
+    # machine readable names of the return_datastores columns
+    datastore_fields = [
+        'datastore', 'capacity', 'provisioned', 'provisioned_pct', 'free', 'free_pct'
+    ]
+    # header rows of return_datastores and return_all_datastores
+    datastore_header = ['Datastore', 'Capacity', 'Provisioned', 'Pct', 'Free Space', 'Pct']
+    all_datastore_header = datastore_header + ['Clusters']
+
+    @classmethod
+    def datastore_row(cls, name, summary):
+        """
+        Returns the disk space of a datastore as a row for return_datastores.
+
+        Args:
+            name (str):    Name of datastore
+            summary (obj): Datastore.Summary object
+        """
+        return cls.datastore_space_row(
+            name, summary.capacity, summary.freeSpace, summary.uncommitted
+        )
+
+    @classmethod
+    def datastore_space_row(cls, name, capacity, free, uncommitted):
+        """
+        Returns the disk space of a datastore as a row for return_datastores.
+
+        Args:
+            name (str):        Name of datastore
+            capacity (int):    Capacity in bytes
+            free (int):        Free space in bytes
+            uncommitted (int): Uncommitted space in bytes, or None
+        """
+        # type is long(bytes)
+        free = int(free)
+        capacity = int(capacity)
+
+        # uncommitted is sometimes None, so we'll convert that to 0.
+        uncommitted = int(uncommitted or 0)
+
+        provisioned = int((capacity - free) + uncommitted)
+
+        provisioned_pct = '{0:.2%}'.format((provisioned / capacity))
+        free_pct = '{0:.2%}'.format((free / capacity))
+
+        return [
+            name, Query.disk_size_format(capacity), Query.disk_size_format(provisioned),
+            provisioned_pct, Query.disk_size_format(free), free_pct
+        ]
+
     @classmethod
     def return_datastores(cls, container, cluster, header=True):
         """
@@ -174,49 +212,68 @@ class Query(Logger):
         """
 
         obj = Query.get_obj(container, cluster)
-        datastore_info = []
 
+        if not isinstance(obj, vim.ComputeResource):
+            return None
 
-        if hasattr(obj, 'datastore'):
-            for datastore in obj.datastore:
-                info = []
-                # type is long(bytes)
-                free = int(datastore.summary.freeSpace)
-                capacity = int(datastore.summary.capacity)
-
-                # uncommitted is sometimes None, so we'll convert that to 0.
-                if not datastore.summary.uncommitted:
-                    uncommitted = int(0)
-                else:
-                    uncommitted = int(datastore.summary.uncommitted)
+        # the datastores and their summary come back in one call
+        datastore_info = [
+            cls.datastore_row(props['name'], props['summary'])
+            for dummy, props in Collector.collect(
+                [obj], {vim.Datastore: ['name', 'summary']},
+                select_set=[Collector.traversal(vim.ComputeResource, 'datastore')]
+            )
+        ]
 
-                provisioned = int((capacity - free) + uncommitted)
+        # sort by datastore name
+        datastore_info.sort(key=lambda x: x[0])
 
-                provisioned_pct = '{0:.2%}'.format((provisioned / capacity))
-                free_pct = '{0:.2%}'.format((free / capacity))
+        if header:
+            datastore_info.insert(0, list(cls.datastore_header))
 
-                info.append(datastore.name)
-                info.append(Query.disk_size_format(capacity))
-                info.append(Query.disk_size_format(provisioned))
-                info.append(provisioned_pct)
-                info.append(Query.disk_size_format(free))
-                info.append(free_pct)
+        return datastore_info
 
-                datastore_info.append(info)
+    @classmethod
+    def return_all_datastores(cls, container, header=True):
+        """
+        Returns a summary of disk space for the datastores of every cluster
+        inside container.  Clusters and datastores are retrieved in a single
+        call, and datastores shared between clusters are listed once with
+        the names of all their clusters in the last column.
 
-            # sort by datastore name
-            datastore_info.sort(key=lambda x: x[0])
+        Args:
+            container (obj): Container object of ClusterComputeResources
+            header (bool):   Enables a header of info to datastore list.
+        """
+        datastores = {}
+        clusters = {}
+
+        for obj, props in Collector.collect(
+                container, {
+                    vim.ComputeResource: ['name', 'datastore'],
+                    vim.Datastore: ['name', 'summary'],
+                },
+                select_set=[Collector.traversal(vim.ComputeResource, 'datastore')]
+        ):
+            if isinstance(obj, vim.Datastore):
+                datastores[obj._moId] = props
+            else:
+                for datastore in props.get('datastore', []):
+                    clusters.setdefault(datastore._moId, []).append(props['name'])
 
-            if header:
-                header = [
-                    'Datastore', 'Capacity', 'Provisioned', 'Pct', 'Free Space', 'Pct'
-                ]
+        datastore_info = [
+            cls.datastore_row(props['name'], props['summary']) +
+            [','.join(sorted(clusters.get(moid, [])))]
+            for moid, props in datastores.iteritems()
+        ]
 
-                datastore_info.insert(0, header)
+        # sort by datastore name
+        datastore_info.sort(key=lambda x: x[0])
 
-            return datastore_info
-        return None
+        if header:
+            datastore_info.insert(0, list(cls.all_datastore_header))
 
+        return datastore_info
 
     @classmethod
     def return_anti_affinity_rules(cls, container, cluster):
@@ -229,73 +286,170 @@ class Query(Logger):
         """
 
         cluster_obj = Query.get_obj(container, cluster)
-        anti_affinity_rules = {}
 
-        if hasattr(cluster_obj, 'configuration'):
-            if hasattr(cluster_obj.configuration, 'rule'):
-                for rule in cluster_obj.configuration.rule:
+        if isinstance(cluster_obj, vim.ClusterComputeResource):
+            return cls.anti_affinity_rules([cluster_obj]).get(cluster, {})
+        return None
 
-                    if isinstance(rule, vim.cluster.AntiAffinityRuleSpec):
+    @classmethod
+    def anti_affinity_rules(cls, clusters):
+        """
+        Returns the antiaffinity rules of several clusters.  The rules of every
+        cluster are retrieved in one call, and the names of all their member
+        VMs in another.
 
-                        aa_vms = []
-                        if hasattr(rule, 'vm'):
-                            for rule_vm in rule.vm:
-                                aa_vms.append(rule_vm.name)
-                        aa_rule = {rule.name : aa_vms}
-                        anti_affinity_rules.update(aa_rule)
+        Args:
+            clusters (obj): Container object or list of ClusterComputeResources
 
-            return anti_affinity_rules
-        return None
+        Returns:
+            rules (dict): Name of cluster as key, dict of rule names and the
+                names of their VMs as value.
+        """
+        cluster_rules = {}
+        for dummy, props in Collector.retrieve(
+                clusters, ['name', 'configuration.rule'], vim.ClusterComputeResource
+        ):
+            cluster_rules[props['name']] = [
+                rule for rule in props.get('configuration.rule', [])
+                if isinstance(rule, vim.cluster.AntiAffinityRuleSpec)
+            ]
+
+        members = {}
+        for rules in cluster_rules.itervalues():
+            for rule in rules:
+                for rule_vm in rule.vm or []:
+                    members[rule_vm._moId] = rule_vm
+
+        vm_names = dict(
+            (obj._moId, props['name'])
+            for obj, props in Collector.retrieve(
+                members.values(), ['name'], vim.VirtualMachine
+            )
+        )
+
+        return dict(
+            (
+                cluster,
+                dict(
+                    (rule.name, [vm_names.get(vm._moId, vm._moId) for vm in rule.vm or []])
+                    for rule in rules
+                )
+            )
+            for cluster, rules in cluster_rules.iteritems()
+        )
 
 
     @classmethod
-    def list_vm_info(cls, container, datacenter):
+    def vm_folder_traversal(cls):
         """
-        Returns a list of names for VMs located inside a datacenter.
+        Returns a TraversalSpec from a datacenter to every VM inside its
+        folder tree.
+        """
+        return Collector.traversal(
+            vim.Datacenter, 'vmFolder',
+            Collector.recursive_traversal(vim.Folder, 'childEntity')
+        )
 
+    @classmethod
+    def host_names(cls, datacenters):
         """
+        Returns the names of the hosts inside datacenters, retrieved in one
+        call through their host folders and clusters.
 
-        obj = Query.get_obj(container, datacenter)
+        Args:
+            datacenters (obj): Container object or list of Datacenter objects
 
-        vms = {}
+        Returns:
+            names (dict): moId as key, name of host as value.
+        """
+        folders = Collector.recursive_traversal(vim.Folder, 'childEntity')
+        folders.selectSet.append(Collector.traversal(vim.ComputeResource, 'host'))
 
-        # recurse through datacenter object attributes looking for vms.
-        if hasattr(obj, 'vmFolder'):
-            for virtmachine in obj.vmFolder.childEntity:
-                if hasattr(virtmachine, 'childEntity'):
-                    for virt in virtmachine.childEntity:
-                        vms.update({virt.name:virt._moId})
-                else:
-                    vms.update({virtmachine.name:virt._moId})
+        return dict(
+            (obj._moId, props['name'])
+            for obj, props in Collector.collect(
+                datacenters, {vim.HostSystem: ['name']},
+                select_set=[Collector.traversal(vim.Datacenter, 'hostFolder', folders)]
+            )
+        )
 
-        return vms
+    # extra columns for list_vm_info
+    vm_info_paths = {
+        'power': 'runtime.powerState',
+        'host': 'runtime.host',
+        'ip': 'guest.ipAddress',
+        'guestId': 'config.guestId',
+    }
 
+    @classmethod
+    def list_vm_info(cls, container, datacenter=None, properties=None, max_objects=1000):
+        """
+        Generator yields the name and moId of every VM located inside a
+        datacenter, or inside every datacenter if datacenter is None.  VMs are
+        retrieved max_objects at a time, so rows are yielded as soon as the
+        first page arrives.
+
+        Args:
+            container (obj):   Container object of Datacenters
+            datacenter (str):  Name of datacenter
+            properties (list): Extra columns from vm_info_paths, i.e. ['power', 'ip']
+            max_objects (int): Page size
+
+        Yields:
+            row (list): name, moId and the extra properties of a VM
+        """
+        properties = list(properties or [])
+
+        if datacenter:
+            datacenters = [Query.get_obj(container, datacenter)]
+        else:
+            datacenters = container
+
+        hosts = {}
+        if 'host' in properties:
+            hosts = cls.host_names(datacenters)
+
+        path_set = ['name'] + [cls.vm_info_paths[prop] for prop in properties]
+
+        for obj, props in Collector.collect(
+                datacenters, {vim.VirtualMachine: path_set},
+                select_set=[cls.vm_folder_traversal()], max_objects=max_objects
+        ):
+            row = [props['name'], obj._moId]
+            for prop in properties:
+                val = props.get(cls.vm_info_paths[prop], None)
+                if prop == 'host' and val is not None:
+                    val = hosts.get(val._moId, val._moId)
+                row.append(str(val) if val is not None else '')
+
+            yield row
 
     @classmethod
     def get_vmid_by_name(cls, container, datacenter, name):
         """
-        Returns the moId of matched name
+        Returns the moId of the VM named name inside a datacenter, at any
+        depth of its folder tree, or raises ValueError if there is none.
 
+        Args:
+            container (obj):  Container object of Datacenters
+            datacenter (str): Name of datacenter
+            name (str):       Name of VM
         """
 
         obj = Query.get_obj(container, datacenter)
 
-        # recurse through datacenter object attributes looking for vm that
-        # matches hostname.
-        if hasattr(obj, 'vmFolder'):
-            for virtmachine in obj.vmFolder.childEntity:
-                if hasattr(virtmachine, 'childEntity'):
-                    for virt in virtmachine.childEntity:
-                        if virt.name == name:
-                            return virt._moId
-                else:
-                    if virt.name == name:
-                        return virt._moId
-        return None
+        for virt, props in Collector.collect(
+                [obj], {vim.VirtualMachine: ['name']},
+                select_set=[cls.vm_folder_traversal()]
+        ):
+            if props.get('name') == name:
+                return virt._moId
+
+        raise ValueError('%s not found.' % (name))
 
 
     @classmethod
-    def get_key(cls, obj, query):
+    def get_key(cls, obj, query, devices=None):
         """
         Method will attempt to return the key associated with device so it can
         be used to edit existing devices. It will loop through all possible
@@ -310,23 +464,21 @@ class Query(Logger):
         Args:
             obj (obj): VirtualMachine object
             query (str): A string representation of the object attribute.
+            devices (obj): DeviceIndex of obj, fetched if None.
 
         Returns:
             keys (tuple): A tuple container the key and controllerKey associated
                 with the device
         """
 
-        if hasattr(obj, 'config'):
-            for item in obj.config.hardware.device:
-                if query in item.deviceInfo.label:
-                    key = item.key
-                    controller_key = item.controllerKey
+        if not devices:
+            devices = DeviceIndex.for_vm(obj)
 
-        return (key, controller_key)
+        return devices.key(query)
 
 
     @classmethod
-    def get_label(cls, obj, query):
+    def get_label(cls, obj, query, devices=None):
         """
         Method will attempt to return the label associated with the device key.
         It will loop through all possible devices and return the key that
@@ -341,17 +493,16 @@ class Query(Logger):
         Args:
             obj (obj): VirtualMachine object
             query (int): A string representation of the object attribute.
+            devices (obj): DeviceIndex of obj, fetched if None.
 
         Returns:
             keys (str): The label associated with the key
         """
 
-        if hasattr(obj, 'config'):
-            for item in obj.config.hardware.device:
-                if query == item.key:
-                    label = item.deviceInfo.label
+        if not devices:
+            devices = DeviceIndex.for_vm(obj)
 
-        return label
+        return devices.label(query)
 
     @classmethod
     def list_guestids(cls):
@@ -371,56 +522,113 @@ class Query(Logger):
         return guestids
 
 
+    # vmconfig keys and the VirtualMachine property paths they are read from
+    vm_config_paths = {
+        'name': 'config.name',
+        'guestId': 'config.guestId',
+        'numCPUs': 'config.hardware.numCPU',
+        'memoryMB': 'config.hardware.memoryMB',
+        'annotation': 'config.annotation',
+        'cpuHotAddEnabled': 'config.cpuHotAddEnabled',
+        'memoryHotAddEnabled': 'config.memoryHotAddEnabled',
+    }
+
     @classmethod
     def vm_config(cls, container, name, createcfg=None):
         """
-        Method will output the config for a Virtual Machine object.
+        Method will output the config for a Virtual Machine object.  Only the
+        properties needed for the config are retrieved, in a single
+        PropertyCollector call.
 
         Args:
+            container (obj): VirtualMachine container object
             name (str): The name of the VM.
+            createcfg (str): Name of a new VM to create a build config for.
 
         Returns:
             cfg (dict): The configs for the selected VM.
         """
         virtmachine = Query.get_obj(container, name)
+        path_set = Query.vm_config_paths.values() + ['config.hardware.device']
+
+        for dummy, props in Collector.retrieve([virtmachine], path_set, vim.VirtualMachine):
+            return Query.build_vm_config(props, createcfg)
+
+        raise ValueError('%s config not found.' % (name))
+
+    @classmethod
+    def vm_configs(cls, container, names, createcfg=None):
+        """
+        Generator yields the configs for many Virtual Machines.  Names are
+        resolved in one pass, and the properties of every VM are retrieved in
+        one multi-object PropertyCollector request.
+
+        Args:
+            container (obj): VirtualMachine container object
+            names (list): Names of the VMs.
+            createcfg (str): Name template for build configs, where {name} is
+                replaced with the name of each VM, i.e. {name}-copy
+
+        Yields:
+            (name, cfg) (tuple): The name of the VM and its config.
+        """
+        virtmachines = []
+        names_by_id = {}
+        for name in names:
+            virtmachine = Query.get_obj(container, name)
+            if virtmachine._moId not in names_by_id:
+                names_by_id[virtmachine._moId] = name
+                virtmachines.append(virtmachine)
+
+        path_set = Query.vm_config_paths.values() + ['config.hardware.device']
+
+        for obj, props in Collector.retrieve(virtmachines, path_set, vim.VirtualMachine):
+            name = names_by_id[obj._moId]
+            if createcfg:
+                yield name, Query.build_vm_config(props, createcfg.format(name=name))
+            else:
+                yield name, Query.build_vm_config(props)
+
+    @classmethod
+    def build_vm_config(cls, props, createcfg=None):
+        """
+        Method builds the config for a Virtual Machine from its retrieved
+        properties.
+
+        Args:
+            props (dict): VirtualMachine property paths and their values, which
+                must include vm_config_paths and config.hardware.device.
+            createcfg (str): Name of a new VM to create a build config for.
+
+        Returns:
+            cfg (dict): The configs for the VM.
+        """
         cfg = {}
-        cfg['vmconfig'] = {}
-        def vm_deep_query(data):
-            """ deep query vmconfig """
-            for key, val in data.__dict__.iteritems():
-                if hasattr(val, '__dict__'):
-                    vm_deep_query(val)
-                else:
-                    if key in (
-                            'memoryMB', 'numCPU', 'guestId', 'name', 'annotation',
-                            'cpuHotAddEnabled', 'memoryHotAddEnabled'
-                    ):
-                        cfg['vmconfig'].update({key : val})
-
-        vm_deep_query(virtmachine.config)
-
-        # overriding key since numCPUs is how the value is assigned
-        cfg['vmconfig']['numCPUs'] = cfg['vmconfig'].pop('numCPU')
+        cfg['vmconfig'] = dict(
+            (key, props.get(path)) for key, path in Query.vm_config_paths.iteritems()
+        )
+
+        devices = DeviceIndex(props.get('config.hardware.device', []))
+
         cfg['vmconfig']['nics'] = {}
         cfg['vmconfig']['disks'] = {}
-        for item in virtmachine.config.hardware.device:
-            if 'Hard disk' in item.deviceInfo.label:
-                scsi = Query.get_label(virtmachine, item.controllerKey)
-                if not scsi in cfg['vmconfig']['disks']:
-                    cfg['vmconfig']['disks'].update({scsi : {}})
-                if not item.capacityInBytes:
-                    # try using the KiloBytes parameter if Bytes is None
-                    capacity = item.capacityInKB / 1024 / 1024
-                    cfg['vmconfig']['disks'][scsi].update({item.deviceInfo.label : int(capacity)})
-                else:
-                    capacity = item.capacityInBytes / 1024 / 1024 / 1024
-                    cfg['vmconfig']['disks'][scsi].update({item.deviceInfo.label : int(capacity)})
-            elif 'Network adapter' in item.deviceInfo.label:
-                cfg['vmconfig']['nics'].update({
-                    item.deviceInfo.label : [
-                        item.macAddress, item.deviceInfo.summary
-                        ]
-                    })
+        for item in devices.by_prefix('Hard disk'):
+            scsi = devices.label(item.controllerKey)
+            if not scsi in cfg['vmconfig']['disks']:
+                cfg['vmconfig']['disks'].update({scsi : {}})
+            if not item.capacityInBytes:
+                # try using the KiloBytes parameter if Bytes is None
+                capacity = item.capacityInKB / 1024 / 1024
+                cfg['vmconfig']['disks'][scsi].update({item.deviceInfo.label : int(capacity)})
+            else:
+                capacity = item.capacityInBytes / 1024 / 1024 / 1024
+                cfg['vmconfig']['disks'][scsi].update({item.deviceInfo.label : int(capacity)})
+        for item in devices.by_prefix('Network adapter'):
+            cfg['vmconfig']['nics'].update({
+                item.deviceInfo.label : [
+                    item.macAddress, item.deviceInfo.summary
+                    ]
+                })
 
         if createcfg:
             # make note of copy before overrides
@@ -450,6 +658,50 @@ class Query(Logger):
 
         return cfg
 
+    @classmethod
+    def datastore_vm_index(cls, container, cluster=None):
+        """
+        Method maps datastores to the VMs stored on them.  Datastores, their
+        VMs and the VM names are retrieved in one call.
+
+        Args:
+            container (obj): ComputeResource container object
+            cluster (str):   Name of cluster, or None for every datastore of
+                every ComputeResource inside container.
+
+        Returns:
+            index (dict): Datastore name as key, sorted list of VM names as value.
+        """
+        if cluster:
+            compute_resources = [Query.get_obj(container, cluster)]
+        else:
+            compute_resources = container
+
+        datastores = {}
+        vm_names = {}
+
+        for obj, props in Collector.collect(
+                compute_resources, {
+                    vim.Datastore: ['name', 'vm'],
+                    vim.VirtualMachine: ['name'],
+                },
+                select_set=[
+                    Collector.traversal(
+                        vim.ComputeResource, 'datastore',
+                        Collector.traversal(vim.Datastore, 'vm')
+                    )
+                ]
+        ):
+            if isinstance(obj, vim.Datastore):
+                datastores[props['name']] = props.get('vm', [])
+            else:
+                vm_names[obj._moId] = props['name']
+
+        return dict(
+            (name, sorted(vm_names[vm._moId] for vm in vms if vm._moId in vm_names))
+            for name, vms in datastores.iteritems()
+        )
+
     @classmethod
     def vm_by_datastore(cls, container, cluster, datastore_name):
         """
@@ -463,18 +715,45 @@ class Query(Logger):
         Returns:
             vms (list): A sorted list of VM names.
         """
-        obj = Query.get_obj(container, cluster)
-        vms = []
-        if hasattr(obj, 'datastore'):
-            for datastore in obj.datastore:
-                if datastore.name == datastore_name:
-                    for virtual_machine in datastore.vm:
-                        vms.append(virtual_machine.name)
-        return sorted(vms)
+        return cls.datastore_vm_index(container, cluster).get(datastore_name, [])
 
 
     @classmethod
-    def is_anti_affinity_rule(cls, cluster_obj, rule_name):
+    def cluster_rules(cls, cluster_obj):
+        """
+        Method returns the DRS rules of a cluster, retrieved in one call.
+
+        Args:
+            cluster_obj (obj): cluster object for search
+
+        Returns:
+            rules (list): ClusterRuleInfo objects
+        """
+        for dummy, props in Collector.retrieve(
+                [cluster_obj], ['configuration.rule'], vim.ClusterComputeResource
+        ):
+            return list(props.get('configuration.rule', []))
+        return []
+
+    @classmethod
+    def vm_rule_index(cls, rules):
+        """
+        Method maps VMs to the DRS rules they are members of.
+
+        Args:
+            rules (list): ClusterRuleInfo objects, i.e. from cluster_rules
+
+        Returns:
+            index (dict): moId of VM as key, list of rule names as value.
+        """
+        index = {}
+        for rule in rules:
+            for rule_vm in getattr(rule, 'vm', None) or []:
+                index.setdefault(rule_vm._moId, []).append(rule.name)
+        return index
+
+    @classmethod
+    def is_anti_affinity_rule(cls, cluster_obj, rule_name, rules=None):
         """
         Method returns true if an AntiAffinity rule of the specified name exists
         in the specified cluster
@@ -482,18 +761,53 @@ class Query(Logger):
         Args:
             cluster_obj (obj): cluster object for search
             rule_name (str): name of the AntiAffinity rule searched for
+            rules (list): cluster_rules of cluster_obj, retrieved if None.
 
         Returns:
             True|False: true if rule exists, false if not
         """
-        for existing_rule in cluster_obj.configuration.rule:
+        if rules is None:
+            rules = cls.cluster_rules(cluster_obj)
+
+        for existing_rule in rules:
             if existing_rule.name == rule_name:
                 return True
         return False
 
 
     @classmethod
-    def is_vm_in_cluster(cls, cluster_obj, vm_obj):
+    def cluster_vm_ids(cls, cluster_obj):
+        """
+        Method returns the moIds of every VM inside a cluster.  One traversal
+        follows the resource pools of the cluster at any depth, including
+        vApps, and the VMs of its hosts, so templates are covered as well.
+
+        Args:
+            cluster_obj (obj): cluster object for search
+
+        Returns:
+            vm_ids (set): moIds of the VMs in the cluster
+        """
+        pool_vms = Collector.traversal(vim.ResourcePool, 'vm')
+        pools = Collector.recursive_traversal(vim.ResourcePool, 'resourcePool')
+        pools.selectSet.append(
+            vmodl.query.PropertyCollector.SelectionSpec(name=pool_vms.name)
+        )
+
+        return set(
+            obj._moId for obj, dummy in Collector.collect(
+                [cluster_obj], {vim.VirtualMachine: []},
+                select_set=[
+                    Collector.traversal(vim.ComputeResource, 'resourcePool', pools, pool_vms),
+                    Collector.traversal(
+                        vim.ComputeResource, 'host', Collector.traversal(vim.HostSystem, 'vm')
+                    ),
+                ]
+            )
+        )
+
+    @classmethod
+    def is_vm_in_cluster(cls, cluster_obj, vm_obj, vm_ids=None):
         """
         Method returns true if the VM object listed exists in the stated cluster object,
         false otherwise.
@@ -501,13 +815,13 @@ class Query(Logger):
         Args:
             cluster_obj (obj): cluster object for search
             vm_obj (obj): vm object searched for
+            vm_ids (set): cluster_vm_ids of cluster_obj, retrieved if None.
+                Pass it in when checking more than one VM.
 
         Returns:
             True|False: true if VM exists in cluster, false if not
         """
-        match = False
-        for clus_vm in cluster_obj.resourcePool.vm:
-            if vm_obj == clus_vm:
-                match = True
+        if vm_ids is None:
+            vm_ids = cls.cluster_vm_ids(cluster_obj)
 
-        return match
+        return vm_obj._moId in vm_ids
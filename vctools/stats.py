@@ -0,0 +1,187 @@
+#!/usr/bin/python
+# vim: ts=4 sw=4 et
+"""RPC instrumentation for vctools."""
+from __future__ import print_function
+import json
+import threading
+import time
+from pyVmomi import SoapStubAdapter # pylint: disable=no-name-in-module
+from vctools import Logger
+
+class RpcStats(Logger):
+    """
+    Class records every SOAP call made through pyVmomi: the method, the type
+    of the managed object it was made on, its latency and the bytes of the
+    response.  Reading a property of a managed object is recorded as
+    get.<property>, which is how a loop of property round trips shows up.
+
+    Calls are counted for the whole process once install is called, and can
+    also be appended to a file as one JSON object per line:
+
+        {"bytes": 5120, "method": "RetrievePropertiesEx", "seconds": 0.081,
+         "time": 1500000000.0, "type": "PropertyCollector"}
+    """
+    # stub methods that are wrapped
+    wrapped = ['InvokeMethod', 'InvokeAccessor', 'GetConnection']
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): NDJSON file the calls are appended to, or None
+        """
+        self.path = path
+        self.stream = None
+        self.calls = {}
+        self.lock = threading.Lock()
+        # property read by the current thread, and bytes of its response
+        self.local = threading.local()
+        self.originals = {}
+
+    def install(self):
+        """ Wraps the methods of SoapStubAdapter, and opens the NDJSON file. """
+        if self.path:
+            self.stream = open(self.path, 'a')
+
+        for name in self.wrapped:
+            self.originals[name] = SoapStubAdapter.__dict__.get(name, None)
+
+        invoke_method = SoapStubAdapter.InvokeMethod
+        invoke_accessor = SoapStubAdapter.InvokeAccessor
+        get_connection = SoapStubAdapter.GetConnection
+        stats = self
+
+        def invoke_method_wrapper(stub, obj, info, args, outer_stub=None):
+            """ Times a method, or the property read that it was made for. """
+            prop, prop_type = getattr(stats.local, 'accessor', None) or (None, None)
+            if prop and info.wsdlName == 'RetrievePropertiesEx':
+                stats.local.accessor = None
+                method, obj_type = 'get.%s' % (prop), prop_type
+            else:
+                method, obj_type = info.wsdlName, stats.type_name(obj)
+
+            stats.local.bytes = 0
+            start = time.time()
+            fault = None
+            try:
+                return invoke_method(stub, obj, info, args, outer_stub)
+            except Exception as err:
+                fault = type(err).__name__
+                raise
+            finally:
+                stats.record(method, obj_type, time.time() - start, stats.local.bytes, fault)
+
+        def invoke_accessor_wrapper(stub, obj, info):
+            """ Names the RetrievePropertiesEx call of a property read. """
+            stats.local.accessor = (info.name, stats.type_name(obj))
+            try:
+                return invoke_accessor(stub, obj, info)
+            finally:
+                stats.local.accessor = None
+
+        def get_connection_wrapper(stub):
+            """ Counts the bytes read from the responses of a connection. """
+            conn = get_connection(stub)
+            if not getattr(conn, 'vctools_stats', False):
+                conn.getresponse = stats.counted_response(conn.getresponse)
+                conn.vctools_stats = True
+            return conn
+
+        SoapStubAdapter.InvokeMethod = invoke_method_wrapper
+        SoapStubAdapter.InvokeAccessor = invoke_accessor_wrapper
+        SoapStubAdapter.GetConnection = get_connection_wrapper
+
+        return self
+
+    def uninstall(self):
+        """ Restores the methods of SoapStubAdapter, and closes the NDJSON file. """
+        for name, original in self.originals.iteritems():
+            if original is None:
+                delattr(SoapStubAdapter, name)
+            else:
+                setattr(SoapStubAdapter, name, original)
+        self.originals.clear()
+
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+    def counted_response(self, getresponse):
+        """
+        Returns getresponse of an HTTP connection, with reads of the response
+        counted.
+
+        Args:
+            getresponse (obj): getresponse method of the connection
+        """
+        def wrapper(*args, **kwargs):
+            """ Counts the bytes read from the response. """
+            resp = getresponse(*args, **kwargs)
+            read = resp.read
+
+            def counted_read(*args):
+                """ Reads from the response. """
+                data = read(*args)
+                self.local.bytes = getattr(self.local, 'bytes', 0) + len(data)
+                return data
+
+            resp.read = counted_read
+            return resp
+
+        return wrapper
+
+    @staticmethod
+    def type_name(obj):
+        """ Returns the vSphere type of a managed object, i.e. VirtualMachine. """
+        return getattr(type(obj), '_wsdlName', type(obj).__name__)
+
+    def record(self, method, obj_type, seconds, size, fault=None):
+        """
+        Adds a call to the totals, and to the NDJSON file.
+
+        Args:
+            method (str):   Method, i.e. RetrievePropertiesEx or get.name
+            obj_type (str): Type of managed object, i.e. PropertyCollector
+            seconds (float): Latency of the call
+            size (int):     Bytes of the response
+            fault (str):    Name of the exception raised, or None
+        """
+        with self.lock:
+            totals = self.calls.setdefault((method, obj_type), [0, 0.0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+            totals[3] += size
+
+            if self.stream:
+                call = {
+                    'time': time.time(), 'method': method, 'type': obj_type,
+                    'seconds': round(seconds, 6), 'bytes': size,
+                }
+                if fault:
+                    call['fault'] = fault
+                self.stream.write(json.dumps(call, sort_keys=True) + '\n')
+                self.stream.flush()
+
+    def summary(self, stream):
+        """
+        Writes a table of the calls by method and type, slowest in total first.
+
+        Args:
+            stream (obj): File object, i.e. sys.stderr
+        """
+        row = '{0:<32} {1:<24} {2:>7} {3:>10} {4:>9} {5:>9} {6:>12}\n'
+        stream.write(row.format('Method', 'Type', 'Calls', 'Total s', 'Avg ms', 'Max ms', 'Bytes'))
+
+        totals = [0, 0.0, 0]
+        for (method, obj_type), (calls, seconds, slowest, size) in sorted(
+                self.calls.iteritems(), key=lambda item: item[1][1], reverse=True
+        ):
+            stream.write(row.format(
+                method, obj_type, calls, '%.3f' % (seconds), '%.1f' % (seconds / calls * 1000),
+                '%.1f' % (slowest * 1000), size
+            ))
+            totals[0] += calls
+            totals[1] += seconds
+            totals[2] += size
+
+        stream.write(row.format('Total', '', totals[0], '%.3f' % (totals[1]), '', '', totals[2]))
@@ -0,0 +1,397 @@
+#!/usr/bin/python
+# vim: ts=4 sw=4 et
+"""Incremental inventory sync for vctools."""
+from pyVmomi import vim, vmodl # pylint: disable=no-name-in-module
+from vctools.collector import Collector
+from vctools.query import Query
+from vctools.views import ViewManager
+from vctools import Logger
+
+class InventorySync(Logger):
+    """
+    Class keeps a local copy of the inventory up to date.  A PropertyCollector
+    filter is registered once, and WaitForUpdatesEx only returns the objects
+    and properties that changed since the stored version token.
+    """
+    properties = {
+        vim.VirtualMachine: [
+            'name', 'parent', 'datastore', 'runtime.host', 'runtime.powerState',
+            'guest.ipAddress', 'config.guestId'
+        ],
+        vim.HostSystem: ['name', 'parent', 'runtime.connectionState'],
+        vim.Datastore: [
+            'name', 'summary.capacity', 'summary.freeSpace', 'summary.uncommitted'
+        ],
+        vim.Network: ['name'],
+        vim.Folder: ['name', 'parent', 'childType'],
+        vim.Datacenter: ['name', 'vmFolder'],
+        vim.ClusterComputeResource: ['name', 'datastore', 'network'],
+    }
+
+    def __init__(self, session, cache):
+        """
+        Args:
+            session (obj): ServiceInstance
+            cache (obj):   InventoryCache object that stores the inventory
+        """
+        self.session = session
+        self.cache = cache
+
+    @classmethod
+    def _value(cls, val):
+        """ Converts property values into something that can be stored. """
+        if isinstance(val, vim.ManagedObject):
+            return val._moId
+        if isinstance(val, list):
+            return [cls._value(item) for item in val]
+        return val
+
+    def create_collector(self):
+        """
+        Method creates a PropertyCollector for this session with one filter
+        over every synced object type.  A dedicated collector keeps its version
+        independent of other filters created by vctools.
+
+        Returns:
+            collector (obj): PropertyCollector object
+        """
+        collector = self.session.content.propertyCollector.CreatePropertyCollector()
+        # not from ViewManager, which destroys its views at logout, while the
+        # filter can be reused by the next sync of a --session-cache session
+        container = ViewManager.create_view(self.session, *self.properties.keys())
+
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=Collector.object_specs(container),
+            propSet=[
+                vmodl.query.PropertyCollector.PropertySpec(type=obj_type, pathSet=path_set)
+                for obj_type, path_set in self.properties.iteritems()
+            ]
+        )
+        collector.CreateFilter(filter_spec, partialUpdates=False)
+
+        self.logger.info('%s collector %s', self.cache.host, collector._moId)
+        return collector
+
+    @classmethod
+    def destroy_collector(cls, collector):
+        """
+        Method destroys a PropertyCollector that can no longer be used, along
+        with the ContainerView of its filter.
+
+        Args:
+            collector (obj): PropertyCollector object
+        """
+        try:
+            views = [
+                obj_spec.obj for prop_filter in collector.filter
+                for obj_spec in prop_filter.spec.objectSet
+                if isinstance(obj_spec.obj, vim.view.ContainerView)
+            ]
+            collector.DestroyPropertyCollector()
+            for view in views:
+                view.DestroyView()
+        except vmodl.fault.ManagedObjectNotFound:
+            pass
+
+    def apply(self, collector, update_set, seen=None):
+        """
+        Method stores the changes of an UpdateSet along with its version.
+
+        Args:
+            collector (obj):  PropertyCollector object
+            update_set (obj): UpdateSet returned by WaitForUpdatesEx
+            seen (set):       moIds of a full sync, updated with the objects
+                of update_set
+
+        Returns:
+            count (int): Number of changed objects
+        """
+        updates = []
+        for filter_update in update_set.filterSet:
+            for obj_update in filter_update.objectSet:
+                assigned = {}
+                removed = []
+                for change in obj_update.changeSet:
+                    if change.op in ('add', 'assign'):
+                        assigned[change.name] = self._value(change.val)
+                    else:
+                        removed.append(change.name)
+
+                updates.append((
+                    obj_update.kind, obj_update.obj._moId, obj_update.obj._wsdlName,
+                    assigned, removed
+                ))
+
+                if seen is not None:
+                    if obj_update.kind == 'leave':
+                        seen.discard(obj_update.obj._moId)
+                    else:
+                        seen.add(obj_update.obj._moId)
+
+        self.cache.apply_updates(collector._moId, update_set.version, updates)
+
+        self.logger.debug('version %s %s changes', update_set.version, len(updates))
+        return len(updates)
+
+    def sync(self, loop=False, wait=60):
+        """
+        Method applies every pending change to the local inventory.  The
+        collector and version of the previous sync are reused if they are
+        still valid, which is only the case while their session is alive.
+        Otherwise a new filter is registered and the full inventory is stored
+        over the previous one, whose objects are only dropped once every batch
+        of the full sync has been stored.  Queries keep reading the previous
+        inventory in the meantime.
+
+        Args:
+            loop (bool): Keep waiting for changes until interrupted.
+            wait (int):  Seconds each WaitForUpdatesEx call may block in a loop.
+
+        Returns:
+            count (int): Number of changed objects
+        """
+        options = vmodl.query.PropertyCollector.WaitOptions(
+            maxWaitSeconds=wait if loop else 0
+        )
+
+        collector_id, version = self.cache.sync_state()
+        update_set = None
+        # moIds of a full sync, None while syncing deltas
+        seen = None
+
+        if collector_id:
+            collector = vmodl.query.PropertyCollector(collector_id, self.session._stub)
+            try:
+                update_set = collector.WaitForUpdatesEx(version, options)
+            except vmodl.fault.ManagedObjectNotFound:
+                self.logger.info(
+                    '%s collector %s expired, full sync', self.cache.host, collector_id
+                )
+                collector_id = None
+            except vmodl.query.InvalidCollectorVersion:
+                self.logger.info(
+                    '%s version %s expired, full sync', self.cache.host, version
+                )
+                self.destroy_collector(collector)
+                collector_id = None
+
+        if not collector_id:
+            collector = self.create_collector()
+            version = ''
+            seen = set()
+            update_set = collector.WaitForUpdatesEx(version, options)
+
+        count = 0
+        while True:
+            if update_set:
+                count += self.apply(collector, update_set, seen)
+                version = update_set.version
+                if seen is not None and not update_set.truncated:
+                    self.cache.prune(seen)
+                    seen = None
+            else:
+                self.cache.touch_sync()
+                if not loop:
+                    break
+
+            update_set = collector.WaitForUpdatesEx(version, options)
+
+        self.logger.info('%s version %s %s changes', self.cache.host, version, count)
+        return count
+
+
+class SyncedInventory(Logger):
+    """
+    Class answers queries from the inventory stored by InventorySync, with
+    the same rows as the Query methods that ask vCenter.  It is only used
+    while the last sync is not older than the inventory ttl of the cache, so
+    a sync running with --loop, or from cron, keeps queries off vCenter.
+    """
+    def __init__(self, objects):
+        """
+        Args:
+            objects (dict): moId as key, dict of properties with an obj_type
+                key as value, see InventoryCache.inventory
+        """
+        self.objects = objects
+
+    @classmethod
+    def for_cache(cls, cache):
+        """
+        Returns the synced inventory of the host of cache, or None if it is
+        missing or stale, or if the cache is disabled or refreshed.
+
+        Args:
+            cache (obj): InventoryCache object
+        """
+        if not cache.enabled or cache.refresh:
+            return None
+
+        age = cache.sync_age()
+        if age is None or age > cache.ttl.get('inventory', 0):
+            return None
+
+        objects = {}
+        for obj_type in cache.inventory_types():
+            for moid, props in cache.inventory(obj_type).iteritems():
+                props['obj_type'] = obj_type
+                objects[moid] = props
+
+        cls.logger.debug('%s %s synced objects', cache.host, len(objects))
+        return cls(objects)
+
+    def of_type(self, *obj_types):
+        """
+        Returns the (moId, properties) of every object of obj_types.
+
+        Args:
+            obj_types (str): Managed object types, i.e. Datastore
+        """
+        return [
+            (moid, props) for moid, props in self.objects.iteritems()
+            if props['obj_type'] in obj_types
+        ]
+
+    def get_obj(self, obj_type, name):
+        """
+        Returns the properties of the object of obj_type named name, or raises
+        ValueError like Query.get_obj.
+
+        Args:
+            obj_type (str): Managed object type, i.e. ClusterComputeResource
+            name (str):     Name of object
+        """
+        for dummy, props in self.of_type(obj_type):
+            if props.get('name') == name:
+                return props
+
+        raise ValueError('%s not found.' % (name))
+
+    def names(self, moids):
+        """ Returns the names of the synced objects in moids. """
+        return [
+            self.objects[moid]['name'] for moid in moids or [] if moid in self.objects
+        ]
+
+    def clusters(self):
+        """ Returns the names of every cluster, like Query.list_obj_attrs. """
+        return [props['name'] for dummy, props in self.of_type('ClusterComputeResource')]
+
+    def networks(self, cluster):
+        """
+        Returns the names of the networks of a cluster.
+
+        Args:
+            cluster (str): Name of cluster
+        """
+        return self.names(self.get_obj('ClusterComputeResource', cluster).get('network'))
+
+    def datastore_row(self, moid):
+        """ Returns the disk space of a datastore, like Query.datastore_row. """
+        props = self.objects[moid]
+        return Query.datastore_space_row(
+            props['name'], props['summary.capacity'], props['summary.freeSpace'],
+            props.get('summary.uncommitted', None)
+        )
+
+    def datastores(self, cluster=None):
+        """
+        Returns the disk space of the datastores of a cluster, like
+        Query.return_datastores, or of every cluster like
+        Query.return_all_datastores if cluster is None.
+
+        Args:
+            cluster (str): Name of cluster
+        """
+        if cluster:
+            props = self.get_obj('ClusterComputeResource', cluster)
+            rows = [
+                self.datastore_row(moid) for moid in props.get('datastore') or []
+                if moid in self.objects
+            ]
+            rows.sort(key=lambda x: x[0])
+            return [list(Query.datastore_header)] + rows
+
+        clusters = {}
+        for dummy, props in self.of_type('ClusterComputeResource'):
+            for moid in props.get('datastore') or []:
+                clusters.setdefault(moid, []).append(props['name'])
+
+        rows = [
+            self.datastore_row(moid) + [','.join(sorted(clusters.get(moid, [])))]
+            for moid, dummy in self.of_type('Datastore')
+        ]
+        rows.sort(key=lambda x: x[0])
+        return [list(Query.all_datastore_header)] + rows
+
+    def folder_paths(self, datacenter):
+        """
+        Returns the VM folders of a datacenter.
+
+        Args:
+            datacenter (obj): Properties of a Datacenter
+
+        Returns:
+            paths (dict): moId as key, path as value, '' for vmFolder itself.
+        """
+        children = {}
+        for moid, props in self.of_type('Folder'):
+            children.setdefault(props.get('parent'), []).append(moid)
+
+        paths = {datacenter['vmFolder']: ''}
+        parents = [datacenter['vmFolder']]
+        while parents:
+            parent = parents.pop()
+            for moid in children.get(parent, []):
+                name = self.objects[moid]['name']
+                paths[moid] = paths[parent] + '/' + name if paths[parent] else name
+                parents.append(moid)
+
+        return paths
+
+    def folders(self, datacenter):
+        """
+        Returns a sorted list of the paths of every VM folder, like
+        Query.list_vm_folders.
+
+        Args:
+            datacenter (str): Name of datacenter
+        """
+        paths = self.folder_paths(self.get_obj('Datacenter', datacenter))
+        return sorted(path for path in paths.itervalues() if path)
+
+    def vms(self, datacenter=None, properties=None):
+        """
+        Returns the name and moId of every VM located inside a datacenter, or
+        inside every datacenter if datacenter is None, like Query.list_vm_info.
+        VMs of a vApp have no folder, so they are not listed.
+
+        Args:
+            datacenter (str):  Name of datacenter
+            properties (list): Extra columns from Query.vm_info_paths
+        """
+        properties = list(properties or [])
+
+        if datacenter:
+            datacenters = [self.get_obj('Datacenter', datacenter)]
+        else:
+            datacenters = [props for dummy, props in self.of_type('Datacenter')]
+
+        folders = set()
+        for props in datacenters:
+            folders.update(self.folder_paths(props))
+
+        rows = []
+        for moid, props in self.of_type('VirtualMachine'):
+            if props.get('parent') not in folders:
+                continue
+
+            row = [props['name'], moid]
+            for prop in properties:
+                val = props.get(Query.vm_info_paths[prop], None)
+                if prop == 'host' and val is not None:
+                    val = self.objects.get(val, {}).get('name', val)
+                row.append(str(val) if val is not None else '')
+            rows.append(row)
+
+        return rows
@@ -2,8 +2,8 @@
 """ Task Monitor Class """
 from __future__ import print_function
 import textwrap
-import time
 import sys
+from pyVmomi import vim, vmodl # pylint: disable=no-name-in-module
 from vctools import Logger
 
 class Tasks(Logger):
@@ -11,25 +11,29 @@ class Tasks(Logger):
     def __init__(self):
         pass
 
+    # properties of a task that task_monitor waits on
+    task_paths = ['info.state', 'info.progress', 'info.error']
+
     @classmethod
-    def question_and_answer(cls, host, **answered):
+    def question_and_answer(cls, host, vm_question, **answered):
         """
         Method handles the questions and answers provided by the program.
 
         Args:
             host (obj): VirtualMachine object
+            vm_question (obj): runtime.question of the VM
             answered (dict): A key value pair of already answered questions.
         """
 
-        if host.runtime.question:
+        if vm_question:
             try:
-                qid = host.runtime.question.id
+                qid = vm_question.id
 
                 if not qid in answered.keys():
                     # systemd does not provide a mechanism for disabling cdrom lock
-                    if 'CD-ROM door' in host.runtime.question.text:
+                    if 'CD-ROM door' in vm_question.text:
                         choices = {}
-                        for option in host.runtime.question.choice.choiceInfo:
+                        for option in vm_question.choice.choiceInfo:
                             choices.update({option.key : option.label})
 
                         for key, val in choices.iteritems():
@@ -37,9 +41,9 @@ class Tasks(Logger):
                                 answer = key
                     else:
                         print('\n')
-                        print('\n'.join(textwrap.wrap(host.runtime.question.text, 80)))
+                        print('\n'.join(textwrap.wrap(vm_question.text, 80)))
                         choices = {}
-                        for option in host.runtime.question.choice.choiceInfo:
+                        for option in vm_question.choice.choiceInfo:
                             choices.update({option.key : option.label})
                             sys.stdout.write('\t%s: %s' % (option.key, option.label))
 
@@ -62,20 +66,80 @@ class Tasks(Logger):
                         host.AnswerVM(qid, str(answer))
                         answered.update({qid:answer})
                         return answered
-            # pass onto next iteration during race condition in task_monitor while loop
+            # pass onto the next update if the question is gone meanwhile
             except AttributeError:
                 pass
 
         return None
 
+    @classmethod
+    def wait_for_updates(cls, task, host=None):
+        """
+        Generator creates a PropertyCollector with a filter over task_paths of
+        task, and runtime.question of host, and yields the properties every
+        time one of them changes.  WaitForUpdatesEx blocks until then, so
+        nothing is polled.  The collector is destroyed when the generator is
+        closed.
+
+        Args:
+            task (obj): Task object
+            host (obj): VirtualMachine object, or None
+
+        Yields:
+            props (dict): Property paths and their current values
+        """
+        collector = vmodl.query.PropertyCollector(
+            'propertyCollector', task._stub
+        ).CreatePropertyCollector()
+
+        object_set = [vmodl.query.PropertyCollector.ObjectSpec(obj=task, skip=False)]
+        prop_set = [
+            vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=cls.task_paths)
+        ]
+        if host:
+            object_set.append(vmodl.query.PropertyCollector.ObjectSpec(obj=host, skip=False))
+            prop_set.append(
+                vmodl.query.PropertyCollector.PropertySpec(
+                    type=vim.VirtualMachine, pathSet=['runtime.question']
+                )
+            )
+
+        try:
+            collector.CreateFilter(
+                vmodl.query.PropertyCollector.FilterSpec(objectSet=object_set, propSet=prop_set),
+                partialUpdates=False
+            )
+
+            props = {}
+            version = ''
+            options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=60)
+            while True:
+                update_set = collector.WaitForUpdatesEx(version, options)
+                # nothing changed before maxWaitSeconds
+                if not update_set:
+                    continue
+
+                version = update_set.version
+                for filter_update in update_set.filterSet:
+                    for obj_update in filter_update.objectSet:
+                        for change in obj_update.changeSet:
+                            if change.op in ('add', 'assign'):
+                                props[change.name] = change.val
+                            else:
+                                props[change.name] = None
+
+                yield props
+        finally:
+            collector.DestroyPropertyCollector()
+
     @classmethod
     def task_monitor(cls, task, question=True, host=False):
         """
         Method monitors the state of called task and outputs the current status.
         Some tasks require that questions be answered before completion, and are
         optional arguments in the case that some tasks don't require them. It
-        will continually check for questions while in progress. The VM object is
-        required if the question argument is True.
+        will answer questions as they are asked while in progress. The VM
+        object is required if the question argument is True.
 
         Args:
             task (obj):      TaskManager object
@@ -87,45 +151,43 @@ class Tasks(Logger):
         # keep track of answered questions
         answered = {}
 
-        while task.info.state == 'running':
-            while task.info.progress:
-                if question and host:
-                    result = Tasks.question_and_answer(host, **answered)
+        props = {}
+        updates = Tasks.wait_for_updates(task, host if question and host else None)
+        try:
+            while props.get('info.state', None) not in ('success', 'error'):
+                props = next(updates)
+
+                if props.get('runtime.question', None):
+                    result = Tasks.question_and_answer(
+                        host, props['runtime.question'], **answered
+                    )
                     if result:
                         answered.update(result)
-                if isinstance(task.info.progress, int):
-                    sys.stdout.write(
-                        '\r[' + task.info.state + '] | ' + str(task.info.progress)
-                    )
-                    sys.stdout.flush()
-                    if task.info.progress == 100:
-                        sys.stdout.write(
-                            '\r[' + task.info.state + '] | ' + str(task.info.progress)
-                        )
-                        sys.stdout.flush()
-                        break
-                else:
+
+                if props.get('info.state', None) == 'running' and isinstance(
+                        props.get('info.progress', None), int
+                ):
+                    sys.stdout.write('\r[running] | ' + str(props['info.progress']))
                     sys.stdout.flush()
-                    break
+        finally:
+            updates.close()
 
-        # pause method to ensure a state of error or success is caught.
-        time.sleep(5)
+        state = props['info.state']
 
-        if task.info.state == 'error':
+        if state == 'error':
             # collect all the error messages we can find
             errors = []
-            errors.append(task.info.error.msg)
+            errors.append(props['info.error'].msg)
 
-            for items in task.info.error.faultMessage:
+            for items in props['info.error'].faultMessage:
                 errors.append(items.message)
 
-            sys.stdout.write('\r[' + task.info.state + '] | ' + ' '.join(errors) + '\n')
-            Tasks.logger.info('[' + task.info.state + '] | ' + ' '.join(errors))
+            sys.stdout.write('\r[' + state + '] | ' + ' '.join(errors) + '\n')
+            Tasks.logger.info('[' + state + '] | ' + ' '.join(errors))
             sys.stdout.flush()
             return False
 
-        if task.info.state == 'success':
-            sys.stdout.write('\r[' + task.info.state + '] | task successfully completed.\n')
-            Tasks.logger.info('[ %s ] task successfully completed.', task.info.state)
-            sys.stdout.flush()
-            return True
+        sys.stdout.write('\r[' + state + '] | task successfully completed.\n')
+        Tasks.logger.info('[ %s ] task successfully completed.', state)
+        sys.stdout.flush()
+        return True
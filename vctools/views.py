@@ -0,0 +1,102 @@
+#!/usr/bin/python
+# vim: ts=4 sw=4 et
+"""ContainerView lifecycle for vctools."""
+import threading
+from pyVmomi import vim, vmodl # pylint: disable=no-name-in-module
+from vctools.inventory import NameIndex
+from vctools import Logger
+
+class ViewManager(Logger):
+    """
+    Class creates ContainerViews under rootFolder the first time a type is
+    needed, and shares them for the rest of the session.  vCenter keeps every
+    view until it is destroyed or the session ends, so destroy is called at
+    logout.
+    """
+    # managers, keyed by session
+    managers = {}
+    # managers are looked up from the threads of query_hosts and the API
+    lock = threading.Lock()
+
+    def __init__(self, session):
+        """
+        Args:
+            session (obj): ServiceInstance
+        """
+        self.session = session
+        self.views = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_session(cls, session):
+        """
+        Returns the manager of session, creating it if necessary.
+
+        Args:
+            session (obj): ServiceInstance
+        """
+        key = id(session._stub)
+        with cls.lock:
+            if key not in cls.managers:
+                cls.managers[key] = cls(session)
+
+            return cls.managers[key]
+
+    @classmethod
+    def release(cls, session):
+        """
+        Destroys the views of session and forgets its manager.
+
+        Args:
+            session (obj): ServiceInstance
+        """
+        with cls.lock:
+            manager = cls.managers.pop(id(session._stub), None)
+        if manager:
+            manager.destroy()
+
+    def view(self, *types):
+        """
+        Returns the ContainerView of types, i.e. vim.VirtualMachine.
+
+        Args:
+            types (obj): Managed object types
+        """
+        with self.lock:
+            if types not in self.views:
+                self.views[types] = self.create_view(self.session, *types)
+
+            return self.views[types]
+
+    @classmethod
+    def create_view(cls, session, *types):
+        """
+        Returns a new ContainerView of types under rootFolder.  Views created
+        here directly are not destroyed at logout, i.e. the view of a filter
+        that outlives the run.
+
+        Args:
+            session (obj): ServiceInstance
+            types (obj):   Managed object types
+        """
+        view = session.content.viewManager.CreateContainerView(
+            session.content.rootFolder, list(types), True
+        )
+        cls.logger.debug('%s %s', view._moId, ' '.join(obj_type.__name__ for obj_type in types))
+        return view
+
+    def destroy(self):
+        """ Destroys every view created by this manager. """
+        with self.lock:
+            views = self.views.values()
+            self.views.clear()
+
+        for view in views:
+            NameIndex.invalidate(view)
+            try:
+                view.DestroyView()
+            except (vmodl.fault.ManagedObjectNotFound, vim.fault.NotAuthenticated):
+                # the view is gone with its session
+                pass
+
+        self.logger.debug('%s views destroyed', len(views))
@@ -5,6 +5,7 @@ from __future__ import print_function
 from random import uniform
 import requests
 from pyVmomi import vim # pylint: disable=E0611
+from vctools.inventory import NameIndex
 from vctools.query import Query
 from vctools.tasks import Tasks
 from vctools import Logger
@@ -378,6 +379,8 @@ class VMConfig(Logger):
         self.logger.debug('%s %s %s %s', folder, datastore, pool, config)
 
         result = Tasks.task_monitor(task, False)
+        # the new VM is not in any name index built before the task
+        NameIndex.invalidate()
         return result
 
 
@@ -396,6 +399,8 @@ class VMConfig(Logger):
         self.logger.debug('%s %s', host.name, config)
         task = host.ReconfigVM_Task(vim.vm.ConfigSpec(**config))
         result = Tasks.task_monitor(task, True, host)
+        if 'name' in config:
+            NameIndex.invalidate()
         return result
 
 
@@ -8,8 +8,10 @@ import socket
 import copy
 import requests
 from pyVmomi import vim # pylint: disable=E0611
+from vctools.devices import DeviceIndex
 from vctools.prompts import Prompts
 from vctools.query import Query
+from vctools.views import ViewManager
 from vctools.vmconfig import VMConfig
 from vctools import Logger
 
@@ -20,22 +22,21 @@ class VMConfigHelper(VMConfig, Logger):
         self.auth = auth
         self.opts = opts
         self.dotrc = dotrc
-        self.datacenters = Query.create_container(
-            self.auth.session, self.auth.session.content.rootFolder,
-            [vim.Datacenter], True
-        )
-        self.clusters = Query.create_container(
-            self.auth.session, self.auth.session.content.rootFolder,
-            [vim.ComputeResource], True
-        )
-        self.folders = Query.create_container(
-            self.auth.session, self.auth.session.content.rootFolder,
-            [vim.Folder], True
-        )
-        self.virtual_machines = Query.create_container(
-            self.auth.session, self.auth.session.content.rootFolder,
-            [vim.VirtualMachine], True
-        )
+
+    @property
+    def datacenters(self):
+        """ Datacenter ContainerView, created on first use. """
+        return ViewManager.for_session(self.auth.session).view(vim.Datacenter)
+
+    @property
+    def clusters(self):
+        """ ComputeResource ContainerView, created on first use. """
+        return ViewManager.for_session(self.auth.session).view(vim.ComputeResource)
+
+    @property
+    def virtual_machines(self):
+        """ VirtualMachine ContainerView, created on first use. """
+        return ViewManager.for_session(self.auth.session).view(vim.VirtualMachine)
 
     def dict_merge(self, first, second):
         """
@@ -84,7 +85,7 @@ class VMConfigHelper(VMConfig, Logger):
         del server_cfg['general']['passwd']
 
         self.logger.info('vmconfig %s', server_cfg)
-        cluster_obj = Query.get_obj(self.clusters.view, cluster)
+        cluster_obj = Query.get_obj(self.clusters, cluster)
 
         # list of cdrom and disk devices
         devices = []
@@ -135,7 +136,7 @@ class VMConfigHelper(VMConfig, Logger):
         spec['vmconfig'].update({'deviceChange':devices})
 
         folder = Query.folders_lookup(
-            self.datacenters.view, self.opts.datacenter, folder
+            self.datacenters, self.opts.datacenter, folder
         )
 
         # delete items that are no longer needed
@@ -166,14 +167,13 @@ class VMConfigHelper(VMConfig, Logger):
             path (str): Path inside datastore where the ISO is located.
             names (str): A tuple of VM names in vCenter.
         """
-        for name in names:
-            host = Query.get_obj(
-                self.virtual_machines.view, name
-            )
+        hosts = [Query.get_obj(self.virtual_machines, name) for name in names]
+        devices = DeviceIndex.for_vms(hosts)
 
+        for name, host in zip(names, hosts):
             print('Mounting [%s] %s on %s' % (datastore, path, name))
             cdrom_cfg = []
-            key, controller = Query.get_key(host, 'CD/DVD')
+            key, controller = Query.get_key(host, 'CD/DVD', devices[host._moId])
 
             cdrom_cfg_opts = {}
             cdrom_cfg_opts.update(
@@ -201,7 +201,7 @@ class VMConfigHelper(VMConfig, Logger):
             names (str): a tuple of VM names in vCenter.
         """
         for name in names:
-            host = Query.get_obj(self.virtual_machines.view, name)
+            host = Query.get_obj(self.virtual_machines, name)
             print('%s changing power state to %s' % (name, state))
             self.logger.debug(host, state)
             self.power(host, state)
@@ -214,11 +214,13 @@ class VMConfigHelper(VMConfig, Logger):
         Args:
             names (tuple): a tuple of VM names in vCenter.
         """
-        for name in names:
+        hosts = [Query.get_obj(self.virtual_machines, name) for name in names]
+        devices = DeviceIndex.for_vms(hosts)
+
+        for name, host in zip(names, hosts):
             print('Umount ISO from %s' % (name))
-            host = Query.get_obj(self.virtual_machines.view, name)
 
-            key, controller = Query.get_key(host, 'CD/DVD')
+            key, controller = Query.get_key(host, 'CD/DVD', devices[host._moId])
 
             self.logger.info('ISO on %s', name)
             cdrom_cfg = []
@@ -374,52 +376,47 @@ class VMConfigHelper(VMConfig, Logger):
         """ Reconfigure a VM disk."""
         devices = []
         edit = True
-        host = Query.get_obj(self.virtual_machines.view, self.opts.name)
+        host = Query.get_obj(self.virtual_machines, self.opts.name)
         disk_cfg_opts = {}
         # KB
         tokbytes = 1024*1024
         label = self.opts.disk_prefix + ' ' + str(self.opts.disk_id)
-        try:
-            key, controller = Query.get_key(host, label)
-        except IOError:
-            pass
         if self.opts.disk_id:
-            for item in host.config.hardware.device:
-                if label == item.deviceInfo.label:
-                    disk_new_size = self.opts.sizeGB * tokbytes
-                    current_size = item.capacityInKB
-                    current_size_gb = int(current_size / (1024*1024))
-                    if disk_new_size == current_size:
-                        raise ValueError(
-                            'New size and existing size are equal'.format()
-                        )
-                    elif disk_new_size < current_size:
-                        raise ValueError(
-                            'Size {0} does not exceed {1}'.format(
-                                disk_new_size, current_size
-                            )
-                        )
-                    disk_delta = disk_new_size - current_size
-                    ds_capacity_kb = item.backing.datastore.summary.capacity / 1024
-                    ds_free_kb = item.backing.datastore.summary.freeSpace / 1024
-                    threshold_pct = 0.10
-                    if (ds_free_kb - disk_delta) / ds_capacity_kb < threshold_pct:
-                        raise ValueError(
-                            '{0} {1} disk space low, aborting.'.format(
-                                host.resourcePool.parent.name,
-                                item.backing.datastore.name
-                            )
-                        )
-                    else:
-                        disk_cfg_opts.update(
-                            {
-                                'size' : disk_new_size,
-                                'key' : key,
-                                'controller' : controller,
-                                'unit' : item.unitNumber,
-                                'filename' : item.backing.fileName
-                            }
-                        )
+            item = DeviceIndex.for_vm(host).by_label(label)
+            disk_new_size = self.opts.sizeGB * tokbytes
+            current_size = item.capacityInKB
+            current_size_gb = int(current_size / (1024*1024))
+            if disk_new_size == current_size:
+                raise ValueError(
+                    'New size and existing size are equal'.format()
+                )
+            elif disk_new_size < current_size:
+                raise ValueError(
+                    'Size {0} does not exceed {1}'.format(
+                        disk_new_size, current_size
+                    )
+                )
+            disk_delta = disk_new_size - current_size
+            ds_summary = item.backing.datastore.summary
+            ds_capacity_kb = ds_summary.capacity / 1024
+            ds_free_kb = ds_summary.freeSpace / 1024
+            threshold_pct = 0.10
+            if (ds_free_kb - disk_delta) / ds_capacity_kb < threshold_pct:
+                raise ValueError(
+                    '{0} {1} disk space low, aborting.'.format(
+                        host.resourcePool.parent.name, ds_summary.name
+                    )
+                )
+            else:
+                disk_cfg_opts.update(
+                    {
+                        'size' : disk_new_size,
+                        'key' : item.key,
+                        'controller' : item.controllerKey,
+                        'unit' : item.unitNumber,
+                        'filename' : item.backing.fileName
+                    }
+                )
             if disk_cfg_opts:
                 devices.append(self.disk_config(edit=edit, **disk_cfg_opts))
                 self.logger.info(
@@ -432,45 +429,40 @@ class VMConfigHelper(VMConfig, Logger):
         """ Reconfigure a VM network adapter """
         devices = []
         edit = True
-        host = Query.get_obj(self.virtual_machines.view, self.opts.name)
+        host = Query.get_obj(self.virtual_machines, self.opts.name)
         nic_cfg_opts = {}
         label = self.opts.nic_prefix + ' ' + str(self.opts.nic_id)
-        try:
-            key, controller = Query.get_key(host, label)
-        except IOError:
-            pass
         if self.opts.nic_id:
-            for item in host.config.hardware.device:
-                if label == item.deviceInfo.label:
-                    if self.opts.network:
-                        nic_cfg_opts.update(
-                            {
-                                'key' : key,
-                                'controller' : controller,
-                                'container' : host.runtime.host.network,
-                                'network' : self.opts.network,
-                                'mac_address': item.macAddress,
-                                'unit' : item.unitNumber,
-                            }
-                        )
-                        if self.opts.driver == 'e1000':
-                            nic_cfg_opts.update({'driver': 'VirtualE1000'})
-                        devices.append(
-                            self.nic_config(edit=edit, **nic_cfg_opts)
-                        )
-                        if devices:
-                            self.logger.info(
-                                '%s label: %s %s network: %s', host.name,
-                                self.opts.nic_prefix, self.opts.nic_id,
-                                self.opts.network
-                            )
-                            self.reconfig(host, **{'deviceChange': devices})
+            item = DeviceIndex.for_vm(host).by_label(label)
+            if self.opts.network:
+                nic_cfg_opts.update(
+                    {
+                        'key' : item.key,
+                        'controller' : item.controllerKey,
+                        'container' : host.runtime.host.network,
+                        'network' : self.opts.network,
+                        'mac_address': item.macAddress,
+                        'unit' : item.unitNumber,
+                    }
+                )
+                if self.opts.driver == 'e1000':
+                    nic_cfg_opts.update({'driver': 'VirtualE1000'})
+                devices.append(
+                    self.nic_config(edit=edit, **nic_cfg_opts)
+                )
+                if devices:
+                    self.logger.info(
+                        '%s label: %s %s network: %s', host.name,
+                        self.opts.nic_prefix, self.opts.nic_id,
+                        self.opts.network
+                    )
+                    self.reconfig(host, **{'deviceChange': devices})
 
     def folder_recfg(self):
         """ Move a VM to another folder """
-        host = Query.get_obj(self.virtual_machines.view, self.opts.name)
+        host = Query.get_obj(self.virtual_machines, self.opts.name)
         folder = Query.folders_lookup(
-            self.datacenters.view, self.opts.datacenter, self.opts.folder
+            self.datacenters, self.opts.datacenter, self.opts.folder
         )
         self.logger.info('%s folder: %s', host.name, self.opts.folder)
         self.mvfolder(host, folder)